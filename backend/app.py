@@ -1,18 +1,51 @@
 # app.py
+import hmac
 import os
 import re
-from flask import Flask, jsonify, session, request
+import time
+from datetime import datetime
+from flask import Flask, jsonify, session, request, g, stream_with_context
 from flask_cors import CORS
-from auth import login_user, register_user
-from database import insert_user_products
-from database import get_connection
-import scraper as scraper
+from concurrent.futures import TimeoutError as FutureTimeout
+from auth import login_user, register_user, AuthOverloaded
+import bulk
+from database import get_connection, pool_stats
+import history
+from http_cache import conditional_json
+import jobs
+import metrics
 
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_KEY")
+# Operational endpoints need "Authorization: Bearer <OPS_TOKEN>" when it is set,
+# and otherwise only answer requests from this host.
+OPS_TOKEN = os.getenv("OPS_TOKEN")
 CORS(app, resources={r"/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}}, supports_credentials=True,)
 
+
+@app.before_request
+def ensure_job_workers():
+    # Started lazily so importing the app never touches the database.
+    jobs.start_workers()
+
+
+@app.before_request
+def start_request_timer():
+    if metrics.METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("http_request_seconds", time.perf_counter() - started,
+                        route=route, method=request.method, status=str(response.status_code))
+    return response
+
+
 def is_valid_email(email):
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -25,6 +58,13 @@ def is_valid_url(url):
     return re.match(pattern, url) is not None
 
 
+def is_ops_request():
+    """Check access to operational endpoints"""
+    if OPS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {OPS_TOKEN}")
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+
 @app.route('/register', methods=['POST'])
 def register():
     # Validate required fields
@@ -57,6 +97,8 @@ def register():
         return jsonify({"message": "Registration successful"}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    except (AuthOverloaded, FutureTimeout):
+        return jsonify({"error": "Server busy, please try again"}), 503, {"Retry-After": "1"}
 
 
 @app.route('/login', methods=['POST'])
@@ -76,14 +118,12 @@ def login():
         return jsonify({"message": "Login successful"}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 401
+    except (AuthOverloaded, FutureTimeout):
+        return jsonify({"error": "Server busy, please try again"}), 503, {"Retry-After": "1"}
 
 
 @app.route('/add_product', methods=['POST'])
 def add_product():
-    query1 = """
-    UPDATE usertrackeditems SET notified = FALSE WHERE usersitemid = %s;
-    """
-
     user_id = session.get('user_id')
 
     if not user_id:
@@ -111,21 +151,86 @@ def add_product():
     if target_price <= 0:
         return jsonify({"error": "Target price must be greater than 0"}), 400
 
-    product = scraper.return_dict(product_url)
-    print(product)
-    current_price = product["product_price"]
+    # The scrape runs on a background worker; poll /add_product_status for the outcome.
+    job_id = jobs.enqueue_add_product(user_id, product_url, target_price)
 
-    if target_price >= current_price:
-        return jsonify({"error": "Target price must be less than current price"}), 400
+    return jsonify({"message": "Product queued", "job_id": job_id}), 202
 
-    usersitemid = insert_user_products(user_id, product_url, target_price)
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query1, (usersitemid,))
-            conn.commit()
+@app.route('/add_product_status', methods=['GET'])
+def add_product_status():
+    user_id = session.get('user_id')
+
+    if not user_id:
+        return jsonify({"error": "Not logged in"}), 401
+
+    try:
+        job_id = int(request.args.get('job_id', ''))
+    except ValueError:
+        return jsonify({"error": "Invalid job ID"}), 400
+
+    job = jobs.get_job(job_id, user_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job), 200
+
+
+@app.route('/import_products', methods=['POST'])
+def import_products():
+    user_id = session.get('user_id')
+
+    if not user_id:
+        return jsonify({"error": "Not logged in"}), 401
+
+    # Either a multipart upload in "file" or a raw CSV / NDJSON body
+    upload = request.files.get('file')
+    if upload is not None:
+        text = upload.read().decode('utf-8-sig', errors='replace')
+        name = (upload.filename or '').lower()
+        default_format = 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'csv'
+    else:
+        text = request.get_data(as_text=True)
+        default_format = 'ndjson' if request.mimetype in ('application/x-ndjson', 'application/ndjson',
+                                                          'application/jsonl') else 'csv'
+    fmt = request.args.get('format', default_format)
 
-    return jsonify({"message": "Product added successfully"}), 200
+    if not text.strip():
+        return jsonify({"error": "No products to import"}), 400
+
+    try:
+        rows, errors = bulk.parse_import(text, fmt)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    result = bulk.import_products(user_id, rows) if rows else {"imported": 0, "queued": [], "errors": []}
+    result["errors"] = sorted(errors + result["errors"], key=lambda e: e["line"])
+
+    # Unknown URLs are scraped by the add-product workers; poll /add_product_status per job.
+    return jsonify(result), 202 if result["queued"] else 200
+
+
+@app.route('/export_products', methods=['GET'])
+def export_products():
+    user_id = session.get('user_id')
+
+    if not user_id:
+        return jsonify({"error": "Not logged in"}), 401
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in bulk.FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(bulk.FORMATS)}"}), 400
+
+    # Rows are read in batches, each on a connection released before it is sent
+    if fmt == 'csv':
+        chunks, mimetype = bulk.export_csv(user_id), 'text/csv'
+    else:
+        chunks, mimetype = bulk.export_ndjson(user_id), 'application/x-ndjson'
+
+    response = app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=price-tracker-export.{fmt}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 
 @app.route('/delete_product', methods=['POST'])
@@ -151,6 +256,7 @@ def delete_product():
     """
     
     query_delete = "DELETE FROM usertrackeditems WHERE usersitemid = %s;"
+    query_touch = "UPDATE accounts SET items_updated_at = NOW() WHERE user_id = %s;"
     
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -161,6 +267,7 @@ def delete_product():
             
             # Delete the product
             cur.execute(query_delete, (product_id,))
+            cur.execute(query_touch, (user_id,))
             conn.commit()
     
     return jsonify({"message": "Product deleted successfully"}), 200
@@ -180,20 +287,59 @@ def dashboard():
     JOIN products p ON ut.usersitemid = p.product_id
     WHERE ut.userprofileid = %s
     """
-    
+    # Changes whenever the user's items or any of their prices change
+    version_query = """
+    SELECT GREATEST(a.items_updated_at, MAX(p.price_updated_at))
+    FROM accounts a
+    LEFT JOIN usertrackeditems ut ON ut.userprofileid = a.user_id
+    LEFT JOIN products p ON p.product_id = ut.usersitemid
+    WHERE a.user_id = %s
+    GROUP BY a.items_updated_at
+    """
+
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(query, (user_id,))
-            products = cur.fetchall()
-    
-    return jsonify({"products": products}), 200
+            cur.execute(version_query, (user_id,))
+            row = cur.fetchone()
+    version = row[0] if row else None
+
+    def render():
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (user_id,))
+                products = cur.fetchall()
+        return {"products": products}
+
+    return conditional_json(f"dashboard:{user_id}", version, render)
+
+
+@app.route('/dashboard/sparklines', methods=['GET'])
+def dashboard_sparklines():
+    user_id = session.get('user_id')
+
+    if not user_id:
+        return jsonify({"error": "Not logged in"}), 401
+
+    try:
+        points = int(request.args.get('points', history.SPARKLINE_POINTS))
+        days = int(request.args.get('days', history.SPARKLINE_DAYS))
+    except ValueError:
+        return jsonify({"error": "points and days must be integers"}), 400
+    if not 1 <= points <= 500 or not 1 <= days <= 3650:
+        return jsonify({"error": "points must be 1-500 and days 1-3650"}), 400
+
+    lines = history.sparklines(user_id, points, days)
+
+    sparklines = {
+        str(product_id): [{"date": t.isoformat(), "price": float(price)} for t, price in line]
+        for product_id, line in lines.items()
+    }
+
+    return jsonify({"sparklines": sparklines}), 200
 
 
 @app.route('/price_graph', methods=['GET'])
 def price_graph():
-    from database import get_connection
-    from flask import jsonify
-    
     product_id = request.args.get('product_id')
     
     if not product_id:
@@ -203,32 +349,52 @@ def price_graph():
         product_id = int(product_id)
     except ValueError:
         return jsonify({"error": "Invalid product ID"}), 400
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT time_change AS t, recorded_price AS price
-        FROM price_history
-        WHERE history_pid = %s
-        UNION ALL
-        SELECT NOW() AS t, current_price AS price
-        FROM products
-        WHERE product_id = %s
-        ORDER BY t ASC
-    """, (product_id, product_id))
-    
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    # Convert to list of dicts for JSON
-    points = [
-        {"date": row[0].isoformat(), "price": float(row[1])}
-        for row in data
-    ]
-    
-    return jsonify({"data": points})
+
+    # Optional range and downsampling: from/to (ISO 8601), resolution or max_points
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"error": "from and to must be ISO 8601 timestamps"}), 400
+
+    resolution = request.args.get('resolution')
+    if resolution and resolution not in history.RESOLUTIONS:
+        return jsonify({"error": f"resolution must be one of {', '.join(history.RESOLUTIONS)}"}), 400
+
+    try:
+        max_points = int(request.args['max_points']) if request.args.get('max_points') else None
+    except ValueError:
+        return jsonify({"error": "max_points must be a positive integer"}), 400
+    if max_points is not None and max_points <= 0:
+        return jsonify({"error": "max_points must be a positive integer"}), 400
+
+    def render():
+        data = history.price_points(product_id, start, end, resolution, max_points)
+
+        # Convert to list of dicts for JSON
+        points = [
+            {"date": row[0].isoformat(), "price": float(row[3]), "min": float(row[1]), "max": float(row[2])}
+            for row in data
+        ]
+        return {"data": points}
+
+    # Cached per query string; bumped whenever the product's history is written
+    return conditional_json(f"price_graph:{request.query_string.decode()}",
+                            history.history_version(product_id), render)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
+@app.route('/pool_stats', methods=['GET'])
+def db_pool_stats():
+    if not is_ops_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(pool_stats()), 200
 
 
 if __name__ == '__main__':
@@ -1,29 +1,122 @@
 import hashlib
-from passlib.context import CryptContext
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from database import get_connection
 from psycopg2 import sql, IntegrityError
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+# Worker processes for bcrypt; 0 hashes on the calling thread.
+AUTH_POOL_WORKERS = int(os.getenv('AUTH_POOL_WORKERS', os.cpu_count() or 1))
+# Hash/verify calls allowed to be queued or running before callers get AuthOverloaded.
+AUTH_QUEUE_DEPTH = int(os.getenv('AUTH_QUEUE_DEPTH', 4 * (os.cpu_count() or 1)))
+AUTH_TIMEOUT = float(os.getenv('AUTH_TIMEOUT', 10))
 
-def hash_password(password: str) -> str:
-    "Hashes a plain text password using bcrypt"
+
+class AuthOverloaded(Exception):
+    "Raised when too many password hashes are already queued"
+
+
+@lru_cache(maxsize=None)
+def pwd_context():
+    "Builds the bcrypt context on first use; passlib and bcrypt are slow to import"
+    from passlib.context import CryptContext
+    # min/max pinned to the configured cost so hashes at any other cost need an update
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+        bcrypt__max_rounds=BCRYPT_ROUNDS,
+    )
+
+
+def _password_bytes(password: str) -> bytes:
     password_bytes = password.encode('utf-8')
     if len(password_bytes) > 72:
         password_bytes = hashlib.sha256(password_bytes).digest()
-    return pwd_context.hash(password_bytes)
+    return password_bytes
+
+
+def hash_password(password: str) -> str:
+    "Hashes a plain text password using bcrypt"
+    return pwd_context().hash(_password_bytes(password))
 
 
 def verify_password(plain_password: str, hashed_password:str) -> bool:
     "Verifies a plain text password against a hashed password"
-    password_bytes = plain_password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password_bytes = hashlib.sha256(password_bytes).digest()
-    return pwd_context.verify(password_bytes, hashed_password)
+    return pwd_context().verify(_password_bytes(plain_password), hashed_password)
+
+
+def verify_and_update(plain_password: str, hashed_password: str):
+    "Verifies a password and returns (ok, new_hash); new_hash is set when the stored cost is outdated"
+    return pwd_context().verify_and_update(_password_bytes(plain_password), hashed_password)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(AUTH_QUEUE_DEPTH)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a threaded WSGI process is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=AUTH_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _discard_executor(executor):
+    "Drops a broken executor so the next call starts a fresh pool"
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _submit(executor, fn, *args):
+    "Submits fn, holding a queue slot until it finishes"
+    if not _slots.acquire(blocking=False):
+        raise AuthOverloaded("Too many login attempts in progress, please retry shortly.")
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def run_hasher(fn, *args):
+    """Runs a bcrypt function on the worker pool and waits for the result.
+
+    Raises AuthOverloaded immediately when AUTH_QUEUE_DEPTH calls are already
+    pending, so callers can shed load instead of queueing behind bcrypt. If a
+    worker died (OOM kill, crash) the pool is rebuilt and the call retried
+    once; AuthOverloaded is raised if the new pool breaks too.
+    """
+    if AUTH_POOL_WORKERS <= 0:
+        return fn(*args)
+    for attempt in range(2):
+        executor = _get_executor()
+        try:
+            return _submit(executor, fn, *args).result(timeout=AUTH_TIMEOUT)
+        except BrokenProcessPool as e:
+            print(f"Password hashing pool broke, restarting it: {e}")
+            _discard_executor(executor)
+    raise AuthOverloaded("Password hashing is restarting, please retry shortly.")
 
 
 def register_user(username: str, password: str, email: str) -> int:
     "Registers a new user into the accounts table and returns the user ID"
-    hashed_pwd = hash_password(password)
+    hashed_pwd = run_hasher(hash_password, password)
 
     query = sql.SQL(
         """
@@ -45,7 +138,7 @@ def register_user(username: str, password: str, email: str) -> int:
 
 
 def login_user(username: str, password: str) -> bool:
-    "Verifies user credentials for login"
+    "Verifies user credentials for login, upgrading the stored hash if BCRYPT_ROUNDS changed"
     query = sql.SQL(
         """
         SELECT user_id, hash_password FROM accounts WHERE username = %s;
@@ -61,12 +154,14 @@ def login_user(username: str, password: str) -> bool:
     
     user_id, hashed_password = row
 
-    if not verify_password(password, hashed_password):
+    ok, new_hash = run_hasher(verify_and_update, password, hashed_password)
+    if not ok:
         raise ValueError("Password is incorrect.")
 
-    return user_id
-    
-
-        
-
+    if new_hash:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE accounts SET hash_password = %s WHERE user_id = %s;", (new_hash, user_id))
+            conn.commit()
 
+    return user_id
@@ -0,0 +1,73 @@
+# benchmarks/fake_smtp.py
+"""Minimal SMTP sink that accepts and discards every message.
+
+Enough of the protocol for notifications.SMTPSessionPool with
+SMTP_STARTTLS=false and no login credentials. Recipients listed in reject are
+refused with 550, and the recipients of every accepted message are kept in
+server.recipients for tests.
+"""
+import socketserver
+import threading
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 bench ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            text = line.decode(errors="replace").strip()
+            command = text.split(" ", 1)[0].upper()
+            if command == "EHLO":
+                self.reply("250-bench")
+                self.reply("250 8BITMIME")
+            elif command == "RCPT":
+                address = text.partition(":")[2].strip().strip("<>")
+                if address in self.server.reject:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif command in ("MAIL", "RSET"):
+                recipients = []
+                self.reply("250 OK")
+            elif command in ("HELO", "NOOP"):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                    self.server.recipients.append(recipients)
+                recipients = []
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, reject=()):
+        super().__init__(address, SinkHandler)
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.recipients = []
+        self.reject = set(reject)
+
+
+def start_sink(host="127.0.0.1", port=0, reject=()):
+    "Starts the sink on a background thread and returns (server, port)"
+    server = SinkServer((host, port), reject)
+    threading.Thread(target=server.serve_forever, name="fake-smtp", daemon=True).start()
+    return server, server.server_address[1]
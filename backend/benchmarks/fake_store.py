@@ -0,0 +1,131 @@
+# benchmarks/fake_store.py
+"""Local stand-in for a Shopify Dawn store.
+
+Serves /products/product-<n> pages with the markup scraper.find_products
+expects. Server delay, client-side render delay, failure rate and which fast
+paths (JSON endpoint, JSON-LD) are exposed are all configurable.
+
+Usage: python benchmarks/fake_store.py --port 8765 --products 1000 --render-delay-ms 300
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE = """<!doctype html>
+<html><head><title>{title}</title>{ld}</head>
+<body>
+<div class="product__title"><h1>{title}</h1></div>
+<div class="price"><div class="price__regular" id="price">{price_html}</div></div>
+<script>
+setTimeout(function () {{
+  document.getElementById("price").innerHTML = '<span class="price-item price-item--regular">${price}</span>';
+}}, {render_delay});
+</script>
+</body></html>
+"""
+
+
+class StoreConfig:
+    def __init__(self, products=1000, delay_ms=0, render_delay_ms=0, failure_rate=0.0,
+                 json_endpoint=True, json_ld=True, seed=0):
+        self.products = products
+        self.delay_ms = delay_ms
+        self.render_delay_ms = render_delay_ms
+        self.failure_rate = failure_rate
+        self.json_endpoint = json_endpoint
+        self.json_ld = json_ld
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def price(self, n):
+        # Prices drift a little over time so refreshes see changes.
+        return f"{10 + n % 250 + (int(time.time()) // 60 + n) % 7 * 0.5:.2f}"
+
+
+def make_handler(config):
+    class StoreHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with config.lock:
+                config.requests += 1
+                fail = config.random.random() < config.failure_rate
+            if config.delay_ms:
+                time.sleep(config.delay_ms / 1000)
+
+            match = re.fullmatch(r"/products/product-(\d+)(\.json)?", self.path.split("?")[0])
+            if not match or int(match.group(1)) >= config.products:
+                self.send_error(404)
+                return
+            if fail:
+                self.send_error(503)
+                return
+
+            n = int(match.group(1))
+            title, price = f"Racket {n}", config.price(n)
+            if match.group(2):
+                if not config.json_endpoint:
+                    self.send_error(404)
+                    return
+                body = json.dumps({"product": {"title": title, "variants": [{"id": n, "price": price}]}})
+                content_type = "application/json"
+            else:
+                ld = ""
+                if config.json_ld:
+                    ld = '<script type="application/ld+json">' + json.dumps(
+                        {"@type": "Product", "name": title, "offers": {"price": price}}
+                    ) + "</script>"
+                # With a render delay the price only appears after client-side JS runs.
+                price_html = "" if config.render_delay_ms else \
+                    f'<span class="price-item price-item--regular">${price}</span>'
+                body = PAGE.format(title=title, ld=ld, price=price, price_html=price_html,
+                                   render_delay=config.render_delay_ms)
+                content_type = "text/html; charset=utf-8"
+
+            data = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StoreHandler
+
+
+def start_store(config, host="127.0.0.1", port=0):
+    "Starts the store on a background thread and returns (server, base_url)"
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-store", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--delay-ms", type=int, default=0)
+    parser.add_argument("--render-delay-ms", type=int, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--no-json-endpoint", action="store_true")
+    parser.add_argument("--no-json-ld", action="store_true")
+    args = parser.parse_args()
+
+    config = StoreConfig(args.products, args.delay_ms, args.render_delay_ms, args.failure_rate,
+                         not args.no_json_endpoint, not args.no_json_ld)
+    server, url = start_store(config, port=args.port)
+    print(f"Serving {args.products} products at {url}/products/product-<n>")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/import_time.py
+"""Import-time regression guard for the backend entry points.
+
+Imports each module in a fresh interpreter with `-X importtime`, reports the
+cumulative import time, and fails when a module exceeds its budget or pulls in
+a dependency that should only load lazily.
+
+Usage (from backend/): python benchmarks/import_time.py [--budget-ms 800] [--json out.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["database", "auth", "app", "price_updater", "worker"]
+# Heavy dependencies that must not be imported until a code path needs them.
+LAZY = ["playwright", "passlib", "bcrypt", "smtplib", "requests"]
+
+# A plain import statement: -X importtime reports nothing for importlib.import_module.
+PROBE = """
+import json, sys
+import {module}
+print(json.dumps(sorted(m for m in {lazy!r} if m in sys.modules)))
+"""
+
+
+def measure(module):
+    "Returns (cumulative import microseconds, eagerly loaded heavy modules)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, lazy=LAZY)],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    cumulative = None
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = [p.strip() for p in line.removeprefix("import time:").split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            cumulative = int(parts[1])
+    if cumulative is None:
+        raise RuntimeError(f"-X importtime reported no line for {module}")
+    return cumulative, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv('IMPORT_BUDGET_MS', 800)))
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    failed = False
+    for module in MODULES:
+        cumulative_us, eager = measure(module)
+        ms = cumulative_us / 1000
+        ok = ms <= args.budget_ms and not eager
+        failed |= not ok
+        results[module] = {"import_ms": round(ms, 1), "eager_heavy_imports": eager, "ok": ok}
+        print(f"{module:15} {ms:8.1f} ms  {'OK' if ok else 'FAIL'}{'  eager: ' + ', '.join(eager) if eager else ''}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"budget_ms": args.budget_ms, "modules": results}, f, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/login_throughput.py
+"""Login password-check throughput under concurrency.
+
+Runs auth.verify_and_update through auth.run_hasher from many threads, both
+inline and on the bcrypt process pool, and reports throughput, p50/p99 latency
+and how many calls were shed with AuthOverloaded. No database is needed.
+
+Usage (from backend/): python benchmarks/login_throughput.py [--threads 32] [--seconds 10] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def run(mode, threads, seconds, hashed):
+    auth.AUTH_POOL_WORKERS = 0 if mode == "inline" else (os.cpu_count() or 1)
+    latencies = []
+    shed = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        nonlocal shed
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                ok, _ = auth.run_hasher(auth.verify_and_update, "correct horse", hashed)
+                assert ok
+            except auth.AuthOverloaded:
+                with lock:
+                    shed += 1
+                time.sleep(0.01)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+
+    return {
+        "mode": mode,
+        "threads": threads,
+        "completed": len(latencies),
+        "shed": shed,
+        "throughput_per_s": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(1000 * percentile(latencies, 50), 2) if latencies else None,
+        "p99_ms": round(1000 * percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    hashed = auth.hash_password("correct horse")
+    # Warm the pool so process start-up is not measured.
+    auth.AUTH_POOL_WORKERS = os.cpu_count() or 1
+    auth.run_hasher(auth.verify_and_update, "correct horse", hashed)
+
+    results = [run(mode, args.threads, args.seconds, hashed) for mode in ("inline", "pool")]
+    for r in results:
+        print(f"{r['mode']:6} {r['throughput_per_s']:8.1f}/s  p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms  shed {r['shed']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"bcrypt_rounds": auth.BCRYPT_ROUNDS, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+# benchmarks/run.py
+"""Offline benchmarks for the scraping, refresh and API hot paths.
+
+Starts benchmarks/fake_store.py, then runs each benchmark in its own
+interpreter so peak RSS is measured per benchmark:
+
+  scrape       scraper.return_dict over the fake store (HTTP fast path, and the
+               browser with --browser)
+  refresh      price_updater.price_refresher over every seeded product
+  notify       price_updater.check_and_notify_targets(full=True) into a local SMTP sink
+  dashboard    GET /dashboard, cold and revalidated with If-None-Match
+  price_graph  GET /price_graph with the default, daily and 30-day ranges
+
+Each result reports throughput, p50/p99 latency and peak RSS. The database
+comes from BENCH_DB_* and must be seeded first with benchmarks/seed.py using
+the same store port.
+
+Usage (from backend/):
+  python benchmarks/run.py [--only scrape,refresh] [--json out.json] [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_store import StoreConfig, start_store  # noqa: E402
+from seed import BENCH_EMAIL_DOMAIN, product_url, use_bench_database  # noqa: E402
+
+# Settings recorded with every run so results are only compared like for like.
+RECORDED_ENV = [
+    "REFRESH_CONCURRENCY", "REFRESH_PER_HOST", "REFRESH_HOST_RPS", "REFRESH_LEASE_BATCH",
+    "BROWSER_POOL_SIZE", "SCRAPER_HTTP_POOL_SIZE", "DB_POOL_MAX_SIZE", "SMTP_POOL_SIZE",
+    "HISTORY_STORAGE_MODE", "PRICE_GRAPH_MAX_POINTS", "METRICS_ENABLED",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(name, latencies, items, elapsed, failures=0, **extra):
+    return {
+        "name": name,
+        "calls": len(latencies),
+        "items": items,
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "throughput_per_s": round(items / elapsed, 2) if elapsed else None,
+        "p50_ms": round(1000 * percentile(latencies, 50), 2) if latencies else None,
+        "p99_ms": round(1000 * percentile(latencies, 99), 2) if latencies else None,
+        **extra,
+    }
+
+
+def measure(fn, inputs, concurrency):
+    """Calls fn on every input from concurrency threads.
+
+    fn returns a falsy value on failure. Returns (latencies, failures, elapsed).
+    """
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+
+    def call(value):
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            ok = fn(value)
+        except Exception as e:
+            print(f"Benchmark call failed: {e}", file=sys.stderr)
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                failures += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, inputs))
+    return latencies, failures, time.perf_counter() - started
+
+
+@contextlib.contextmanager
+def quiet(enabled):
+    "Silences the backend's progress prints while measuring"
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def query_one(sql, params=()):
+    from database import get_connection
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            row = cur.fetchone()
+        conn.commit()
+    return row
+
+
+def _fetch_all(sql, params=()):
+    from database import get_connection
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+
+def require_seeded(args):
+    """Exits the benchmark unless seed.py has populated the bench database for this store.
+
+    Returns (user_ids, product_ids).
+    """
+    user_ids = [row[0] for row in _fetch_all(
+        "SELECT user_id FROM accounts WHERE email LIKE %s ORDER BY user_id;", ("%@" + BENCH_EMAIL_DOMAIN,))]
+    product_ids = [row[0] for row in _fetch_all(
+        "SELECT product_id FROM products WHERE product_url LIKE %s ORDER BY product_id;",
+        (args.base_url + "/products/%",))]
+    if not user_ids or not product_ids:
+        sys.exit(f"No seeded users or products for {args.base_url}; "
+                 f"run benchmarks/seed.py --base-url {args.base_url} first")
+    return user_ids, product_ids
+
+
+def bench_scrape(args):
+    import extractors
+    import scraper
+    from browser_pool import close_pool
+
+    rng = random.Random(args.seed)
+    urls = [product_url(args.base_url, rng.randrange(args.store_products)) for _ in range(args.scrape_calls)]
+    modes = ["http"] + (["browser"] if args.browser else [])
+
+    def scrape(url):
+        try:
+            return scraper.return_dict(url)
+        except scraper.ScrapeError:
+            return None
+
+    results = []
+    for mode in modes:
+        extractors.HTTP_FASTPATH = mode == "http"
+        with quiet(not args.verbose):
+            scrape(urls[0])  # warm the session or browser pool
+            latencies, failures, elapsed = measure(scrape, urls, args.concurrency)
+        results.append(summarize(f"scrape_{mode}", latencies, len(urls) - failures, elapsed, failures,
+                                 concurrency=args.concurrency))
+    close_pool()
+    return results
+
+
+def _reset_refresh_state(args):
+    query_one("""
+    UPDATE products SET next_check_at = NULL, lease_owner = NULL, lease_expires_at = NULL
+    WHERE product_url LIKE %s RETURNING 1;
+    """, (args.base_url + "/products/%",))
+
+
+def bench_refresh(args):
+    import price_updater
+    from browser_pool import close_pool
+
+    require_seeded(args)
+    latencies = []
+    items = 0
+    for _ in range(args.repeat):
+        _reset_refresh_state(args)
+        run_started = query_one("SELECT NOW();")[0]
+        started = time.perf_counter()
+        with quiet(not args.verbose):
+            price_updater.price_refresher()
+        latencies.append(time.perf_counter() - started)
+        items += query_one("SELECT COUNT(*) FROM products WHERE last_checked_at >= %s;", (run_started,))[0]
+    close_pool()
+    # One call is one full run; throughput is products refreshed per second.
+    return [summarize("refresh", latencies, items, sum(latencies))]
+
+
+def bench_notify(args):
+    from fake_smtp import start_sink
+
+    sink, port = start_sink()
+    os.environ.update({"SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(port), "SMTP_STARTTLS": "false"})
+    os.environ["SENDER_PASSWORD"] = ""  # no login; load_dotenv will not override it
+    os.environ.setdefault("SENDER_EMAIL", "alerts@bench.invalid")
+    import price_updater
+
+    require_seeded(args)
+    latencies = []
+    items = 0
+    for _ in range(args.repeat):
+        query_one("UPDATE usertrackeditems SET notified = FALSE RETURNING 1;")
+        before = query_one("SELECT COUNT(*) FROM notification_deliveries;")[0]
+        started = time.perf_counter()
+        with quiet(not args.verbose):
+            price_updater.check_and_notify_targets(full=True)
+        latencies.append(time.perf_counter() - started)
+        items += query_one("SELECT COUNT(*) FROM notification_deliveries;")[0] - before
+    sink.shutdown()
+    return [summarize("notify", latencies, items, sum(latencies), emails=sink.messages)]
+
+
+def _client_factory():
+    "Returns a function giving each thread its own Flask test client"
+    os.environ.setdefault("FLASK_KEY", "bench")
+    from app import app
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        return local.client
+
+    return client
+
+
+def bench_dashboard(args):
+    import http_cache
+
+    client = _client_factory()
+    user_ids, _ = require_seeded(args)
+    rng = random.Random(args.seed)
+    users = rng.sample(user_ids, min(args.api_calls, len(user_ids)))
+    etags = {}
+
+    def get(user_id, etag=None):
+        c = client()
+        with c.session_transaction() as session:
+            session["user_id"] = user_id
+        headers = {"If-None-Match": etag} if etag else {}
+        response = c.get("/dashboard", headers=headers)
+        etags[user_id] = response.headers.get("ETag")
+        return response.status_code in (200, 304)
+
+    http_cache.response_cache = http_cache.ResponseCache()
+    results = []
+    latencies, failures, elapsed = measure(get, users, args.concurrency)
+    results.append(summarize("dashboard", latencies, len(users) - failures, elapsed, failures))
+    latencies, failures, elapsed = measure(lambda u: get(u, etags[u]), users, args.concurrency)
+    results.append(summarize("dashboard_304", latencies, len(users) - failures, elapsed, failures))
+    return results
+
+
+def bench_price_graph(args):
+    import http_cache
+
+    client = _client_factory()
+    _, product_ids = require_seeded(args)
+    rng = random.Random(args.seed)
+    month_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    variants = {
+        "price_graph": {},
+        "price_graph_daily": {"resolution": "day"},
+        "price_graph_30d": {"from": month_ago},
+    }
+
+    results = []
+    for name, params in variants.items():
+        # A fresh cache and distinct products so every call renders.
+        http_cache.response_cache = http_cache.ResponseCache()
+        products = rng.sample(product_ids, min(args.api_calls, len(product_ids)))
+
+        def get(product_id):
+            response = client().get("/price_graph", query_string={"product_id": product_id, **params})
+            return response.status_code == 200
+
+        latencies, failures, elapsed = measure(get, products, args.concurrency)
+        results.append(summarize(name, latencies, len(products) - failures, elapsed, failures))
+    return results
+
+
+BENCHMARKS = {
+    "scrape": bench_scrape,
+    "refresh": bench_refresh,
+    "notify": bench_notify,
+    "dashboard": bench_dashboard,
+    "price_graph": bench_price_graph,
+}
+
+
+def run_child(name, args, output):
+    "Runs one benchmark in this process and writes its results to output"
+    use_bench_database()
+    results = BENCHMARKS[name](args)
+    for result in results:
+        result["peak_rss_mb"] = peak_rss_mb()
+        result["peak_child_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    with open(output, "w") as f:
+        json.dump(results, f)
+
+
+def run_isolated(name, args):
+    "Runs one benchmark in a fresh interpreter and returns its results"
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output = f.name
+    try:
+        env = dict(os.environ, BENCH_ARGS=json.dumps(vars(args)))
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name, "--child-output", output],
+                       env=env, check=True)
+        with open(output) as f:
+            return json.load(f)
+    except subprocess.CalledProcessError as e:
+        print(f"Benchmark {name} failed with exit code {e.returncode}")
+        return [{"name": name, "error": f"exit code {e.returncode}"}]
+    finally:
+        os.unlink(output)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for r in results:
+        old = baseline.get(r["name"])
+        if not old or "error" in r or "error" in old:
+            continue
+        changes = []
+        for key in ("throughput_per_s", "p50_ms", "p99_ms", "peak_rss_mb"):
+            if r.get(key) is not None and old.get(key):
+                changes.append(f"{key} {100 * (r[key] - old[key]) / old[key]:+.1f}%")
+        print(f"{r['name']:18} {'  '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated benchmarks to run")
+    parser.add_argument("--store-port", type=int, default=8765)
+    parser.add_argument("--store-products", type=int, default=5000, help="must cover the seeded products")
+    parser.add_argument("--delay-ms", type=int, default=0, help="server-side delay per store request")
+    parser.add_argument("--render-delay-ms", type=int, default=0, help="client-side delay before the price renders")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--no-json-endpoint", action="store_true", help="make shopify_json miss")
+    parser.add_argument("--no-json-ld", action="store_true", help="make json_ld miss")
+    parser.add_argument("--browser", action="store_true", help="also benchmark the browser path (needs playwright)")
+    parser.add_argument("--scrape-calls", type=int, default=200)
+    parser.add_argument("--api-calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3, help="runs of refresh and notify")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep the backend's prints")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="print changes against an earlier --json file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, argparse.Namespace(**json.loads(os.environ["BENCH_ARGS"])), args.child_output)
+        return
+
+    use_bench_database()
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmarks: {', '.join(unknown)}; choose from {', '.join(BENCHMARKS)}")
+
+    store_config = StoreConfig(args.store_products, args.delay_ms, args.render_delay_ms, args.failure_rate,
+                               not args.no_json_endpoint, not args.no_json_ld, args.seed)
+    store, args.base_url = start_store(store_config, port=args.store_port)
+
+    results = []
+    try:
+        for name in names:
+            print(f"Running {name}")
+            results.extend(run_isolated(name, args))
+    finally:
+        store.shutdown()
+
+    for r in results:
+        if "error" in r:
+            print(f"{r['name']:18} {r['error']}")
+            continue
+        print(f"{r['name']:18} {r['throughput_per_s']:10.1f}/s  p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms  "
+              f"failures {r['failures']}  peak RSS {r['peak_rss_mb']} MB")
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "env": {key: os.environ[key] for key in RECORDED_ENV if key in os.environ},
+        "store_requests": store_config.requests,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    if any("error" in r for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
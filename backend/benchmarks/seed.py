@@ -0,0 +1,143 @@
+# benchmarks/seed.py
+"""Seeds a local benchmark database with users, products and price history.
+
+Product URLs point at benchmarks/fake_store.py, so the refresher can scrape
+them offline. The database is taken from BENCH_DB_NAME / BENCH_DB_USER /
+BENCH_DB_PASSWORD / BENCH_DB_HOST / BENCH_DB_PORT, which replace the DB_*
+settings; BENCH_DB_NAME is required so a benchmark never writes to the
+configured application database by accident.
+
+Usage (from backend/): python benchmarks/seed.py --users 1000 --products 5000 --reset
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_EMAIL_DOMAIN = "bench.invalid"
+
+
+def use_bench_database():
+    "Points the backend at the BENCH_DB_* database; must run before database is imported"
+    if not os.getenv("BENCH_DB_NAME"):
+        sys.exit("Set BENCH_DB_NAME (and BENCH_DB_USER/PASSWORD/HOST/PORT) to a scratch database")
+    for key in ("NAME", "USER", "PASSWORD", "HOST", "PORT"):
+        value = os.getenv(f"BENCH_DB_{key}")
+        if value is not None:
+            os.environ[f"DB_{key}"] = value
+
+
+def store_price(n):
+    "The undrifted price fake_store serves for product n"
+    return 10 + n % 250
+
+
+def product_url(base_url, n):
+    return f"{base_url}/products/product-{n}"
+
+
+def seed(base_url, users, products, items_per_user, hit_rate, history_days, history_interval_hours,
+         reset=False, seed_value=0):
+    "Creates the schema and inserts the benchmark data set; returns row counts"
+    from psycopg2.extras import execute_values
+    from database import get_connection
+    from schema import apply_schema
+
+    rng = random.Random(seed_value)
+    items_per_user = min(items_per_user, products)
+    apply_schema()
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if reset:
+                cur.execute("""
+                TRUNCATE accounts, products, usertrackeditems, price_history, price_history_hourly,
+                         price_history_daily, price_changes, scrape_jobs, notification_deliveries, scrape_cache
+                RESTART IDENTITY CASCADE;
+                """)
+
+            started = time.monotonic()
+            execute_values(
+                cur,
+                "INSERT INTO products (product_url, product_name, current_price) VALUES %s "
+                "ON CONFLICT (product_url) DO NOTHING;",
+                [(product_url(base_url, n), f"Racket {n}", store_price(n)) for n in range(products)],
+                page_size=1000,
+            )
+            cur.execute("SELECT product_id, current_price FROM products WHERE product_url LIKE %s ORDER BY product_id;",
+                        (base_url + "/products/%",))
+            product_rows = cur.fetchall()
+
+            # The hash is never verified; login benchmarks live in login_throughput.py.
+            execute_values(
+                cur,
+                "INSERT INTO accounts (username, hash_password, email) VALUES %s "
+                "ON CONFLICT (username) DO NOTHING;",
+                [(f"bench{u}", "!", f"bench{u}@{BENCH_EMAIL_DOMAIN}") for u in range(users)],
+                page_size=1000,
+            )
+            cur.execute("SELECT user_id FROM accounts WHERE email LIKE %s ORDER BY user_id;",
+                        ("%@" + BENCH_EMAIL_DOMAIN,))
+            user_ids = [row[0] for row in cur.fetchall()]
+
+            items = []
+            for i, user_id in enumerate(user_ids):
+                for j in range(items_per_user):
+                    product_id, price = product_rows[(i * items_per_user + j) % len(product_rows)]
+                    # Targets above the current price are due for an alert straight away.
+                    factor = 1.1 if rng.random() < hit_rate else 0.5
+                    items.append((product_id, user_id, round(float(price) * factor, 2)))
+            execute_values(
+                cur,
+                "INSERT INTO usertrackeditems (usersitemid, userprofileid, target_price) VALUES %s "
+                "ON CONFLICT DO NOTHING;",
+                items,
+                page_size=1000,
+            )
+
+            cur.execute("""
+            INSERT INTO price_history (history_pid, recorded_price, time_change)
+            SELECT p.product_id,
+                   ROUND((p.current_price * (1 + 0.1 * SIN(p.product_id + EXTRACT(EPOCH FROM t) / 86400)))::numeric, 2),
+                   t
+            FROM products p,
+                 generate_series(NOW() - make_interval(days => %s), NOW(), make_interval(hours => %s)) AS t
+            WHERE p.product_url LIKE %s;
+            """, (history_days, history_interval_hours, base_url + "/products/%"))
+            history_rows = cur.rowcount
+            cur.execute("ANALYZE;")
+        conn.commit()
+
+    counts = {
+        "users": len(user_ids),
+        "products": len(product_rows),
+        "tracked_items": len(items),
+        "price_history": history_rows,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+    print(f"Seeded {counts}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8765", help="fake_store address")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--items-per-user", type=int, default=20)
+    parser.add_argument("--hit-rate", type=float, default=0.05, help="share of items already below target")
+    parser.add_argument("--history-days", type=int, default=90)
+    parser.add_argument("--history-interval-hours", type=int, default=6)
+    parser.add_argument("--reset", action="store_true", help="truncate all tables first")
+    args = parser.parse_args()
+
+    use_bench_database()
+    seed(args.base_url, args.users, args.products, args.items_per_user, args.hit_rate,
+         args.history_days, args.history_interval_hours, args.reset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# browser_pool.py
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', 2))
+BROWSER_MAX_USES = int(os.getenv('BROWSER_MAX_USES', 100))
+BROWSER_HEADLESS = os.getenv('BROWSER_HEADLESS', 'true').lower() != 'false'
+
+
+class PoolBusy(Exception):
+    """Raised when a job waited too long for a free browser and never started.
+
+    This is local congestion, so callers must not count it against the store.
+    """
+
+
+class _BrowserSlot(threading.Thread):
+    """Worker thread owning one Chromium instance.
+
+    Playwright's sync API is bound to the thread that started it, so each browser
+    lives on its own thread and scrapes are handed to it through the pool queue.
+    """
+
+    def __init__(self, pool, index):
+        super().__init__(name=f"browser-slot-{index}", daemon=True)
+        self.pool = pool
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.uses = 0
+
+    def _launch(self):
+        from playwright.sync_api import sync_playwright
+
+        with metrics.span("browser_launch"):
+            if self.playwright is None:
+                self.playwright = sync_playwright().start()
+            self.browser = self.playwright.chromium.launch(headless=BROWSER_HEADLESS)
+            self.context = self.browser.new_context()
+        self.uses = 0
+
+    def _shutdown_browser(self):
+        try:
+            if self.browser is not None:
+                self.browser.close()
+        except Exception as e:
+            print(f"Error closing browser: {e}")
+        self.browser = None
+        self.context = None
+
+    def _recycle(self, reason):
+        print(f"Recycling {self.name} ({reason})")
+        self._shutdown_browser()
+        try:
+            self._launch()
+        except Exception as e:
+            # Leave the browser unset; the next job tries to launch it again.
+            print(f"Error relaunching browser on {self.name}: {e}")
+            self._shutdown_browser()
+
+    def run(self):
+        # Only the None sentinel ends the loop; a failing browser never kills the slot.
+        while True:
+            job = self.pool._jobs.get()
+            if job is None:
+                break
+            try:
+                self._run_job(*job)
+            except Exception as e:
+                print(f"Error in {self.name}: {e}")
+                self._shutdown_browser()
+
+        self._shutdown_browser()
+        if self.playwright is not None:
+            try:
+                self.playwright.stop()
+            except Exception as e:
+                print(f"Error stopping playwright: {e}")
+
+    def _run_job(self, fn, future, timeout):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            if self.browser is None:
+                self._launch()
+            elif not self.browser.is_connected():
+                self._recycle("disconnected")
+            page = self.context.new_page()
+        except Exception as e:
+            self._shutdown_browser()
+            future.set_exception(e)
+            return
+
+        # The budget is enforced in the page itself: a Future cannot stop a running job.
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+            page.set_default_timeout(timeout * 1000)
+        try:
+            future.set_result(fn(page, deadline))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            try:
+                page.close()
+            except Exception:
+                pass
+            self.uses += 1
+
+        try:
+            connected = self.browser.is_connected()
+        except Exception:
+            connected = False
+        if not connected:
+            self._recycle("crashed")
+        elif deadline is not None and time.monotonic() > deadline:
+            # The caller has given up; don't trust a browser that ignored the page timeout.
+            self._recycle("over its deadline")
+        elif self.uses >= self.pool.max_uses:
+            self._recycle(f"{self.uses} uses")
+
+
+class BrowserPool:
+    """Long-lived pool of headless browsers shared by the API and the refresher jobs."""
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES):
+        self.size = size
+        self.max_uses = max_uses
+        self._jobs = queue.Queue()
+        self._slots = [_BrowserSlot(self, i) for i in range(size)]
+        for slot in self._slots:
+            slot.start()
+
+    def submit(self, fn, timeout=None) -> Future:
+        """Queues fn(page, deadline) to run on the next free browser and returns its future.
+
+        With a timeout, the page's default Playwright timeout is set to it and
+        deadline is the time.monotonic() value fn must finish by (else None).
+        """
+        future = Future()
+        self._jobs.put((fn, future, timeout))
+        return future
+
+    def run(self, fn, timeout=None, queue_timeout=None):
+        """Runs fn(page, deadline) on a pooled browser page and returns its result.
+
+        timeout only starts once fn starts, so time spent queued for a browser
+        is never reported as a slow store. Raises PoolBusy if no browser picks
+        the job up within queue_timeout; the queued job is cancelled so it never
+        runs. A running job cannot be cancelled, so fn must keep its own waits
+        within deadline; a slot whose job overruns it is recycled.
+        """
+        started = threading.Event()
+
+        def job(page, deadline):
+            started.set()
+            return fn(page, deadline)
+
+        future = self.submit(job, timeout)
+        # A failed launch finishes the future without ever starting job.
+        future.add_done_callback(lambda _: started.set())
+        if not started.wait(queue_timeout) and future.cancel():
+            raise PoolBusy(f"No free browser after {queue_timeout}s")
+        return future.result(timeout=timeout)
+
+    def close(self):
+        "Stops every slot after its current scrape and closes the browsers"
+        for _ in self._slots:
+            self._jobs.put(None)
+        for slot in self._slots:
+            slot.join(timeout=30)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> BrowserPool:
+    "Returns the process-wide browser pool, starting it on first use"
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(close_pool)
+        return _pool
+
+
+def close_pool():
+    "Shuts down the process-wide browser pool if it was started"
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
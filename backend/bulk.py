@@ -0,0 +1,259 @@
+# bulk.py
+"""Bulk watchlist import and streaming export.
+
+Imports accept CSV or NDJSON rows of (url, target_price). URLs already in
+products are linked without scraping and tracked items are upserted in
+batches. Unknown URLs are queued as add-product jobs (jobs.py) so no scrape
+runs on the request thread; clients poll /add_product_status for each job.
+
+Exports stream a user's products and price history in batches of products,
+each read on a pooled connection that is returned before the batch is sent,
+so a slow download never holds a connection and memory stays bounded.
+"""
+import csv
+import io
+import json
+import os
+import re
+from decimal import Decimal, InvalidOperation
+
+from psycopg2.extras import execute_values
+
+from database import get_connection
+import history
+import jobs
+from scheduling import schedule_next_checks
+
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 500))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+# Products (with all their history points) read per query of an export.
+EXPORT_BATCH_PRODUCTS = int(os.getenv('EXPORT_BATCH_PRODUCTS', 100))
+# Rows buffered into each chunk of a streamed response.
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 500))
+
+FORMATS = ("csv", "ndjson")
+# products.current_price and usertrackeditems.target_price are NUMERIC(10, 2).
+MAX_PRICE = Decimal("99999999.99")
+URL_PATTERN = re.compile(r'^https?://.+')
+
+EXPORT_COLUMNS = ("product_id", "product_name", "product_url", "current_price", "target_price",
+                  "recorded_price", "recorded_at")
+
+
+def parse_import(text, fmt):
+    """Parses an upload into rows.
+
+    Returns ({url: (line, target_price)}, errors); later lines win for repeated
+    URLs. errors is a list of {"line", "error"}. Raises ValueError when the
+    upload is unusable as a whole.
+    """
+    if fmt == "csv":
+        records = _csv_records(text)
+    elif fmt == "ndjson":
+        records = _ndjson_records(text)
+    else:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+    rows = {}
+    errors = []
+    for line, record in records:
+        if isinstance(record, str):
+            errors.append({"line": line, "error": record})
+            continue
+        url, target = record
+        if url is None:
+            errors.append({"line": line, "error": "URL is required"})
+            continue
+        if not isinstance(url, str):
+            errors.append({"line": line, "error": "URL must be a string"})
+            continue
+        url = url.strip()
+        if not URL_PATTERN.match(url):
+            errors.append({"line": line, "error": "Invalid URL format"})
+            continue
+        if target is None or isinstance(target, (bool, dict, list)):
+            errors.append({"line": line, "error": "Target price must be a valid number"})
+            continue
+        try:
+            target_price = Decimal(str(target).strip())
+        except (InvalidOperation, ValueError):
+            errors.append({"line": line, "error": "Target price must be a valid number"})
+            continue
+        if not target_price.is_finite():
+            errors.append({"line": line, "error": "Target price must be a finite number"})
+            continue
+        if target_price <= 0:
+            errors.append({"line": line, "error": "Target price must be greater than 0"})
+            continue
+        if target_price > MAX_PRICE:
+            errors.append({"line": line, "error": "Target price is too large"})
+            continue
+        rows[url] = (line, target_price)
+        if len(rows) > IMPORT_MAX_ROWS:
+            raise ValueError(f"Imports are limited to {IMPORT_MAX_ROWS} products")
+    return rows, errors
+
+
+def _csv_records(text):
+    reader = csv.reader(io.StringIO(text))
+    header = None
+    for line, values in enumerate(reader, start=1):
+        if not values or not any(v.strip() for v in values):
+            continue
+        if line == 1 and "url" in [v.strip().lower() for v in values]:
+            header = [v.strip().lower() for v in values]
+            continue
+        if header:
+            record = dict(zip(header, values))
+            yield line, (record.get("url"), record.get("target_price"))
+        elif len(values) < 2:
+            yield line, "Expected url,target_price"
+        else:
+            yield line, (values[0], values[1])
+
+
+def _ndjson_records(text):
+    for line, raw in enumerate(text.splitlines(), start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            yield line, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield line, "Expected an object with url and target_price"
+            continue
+        yield line, (record.get("url") or record.get("product_url"), record.get("target_price"))
+
+
+def import_products(user_id, rows):
+    """Links every parsed row to the user.
+
+    Known products are linked right away; unknown URLs are queued as
+    add-product jobs. Returns {"imported", "queued", "errors"}, where queued is
+    a list of {"line", "url", "job_id"} and errors are per line.
+    """
+    errors = []
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT product_url, product_id, current_price FROM products WHERE product_url = ANY(%s);",
+                        (list(rows),))
+            known = {url: (product_id, price) for url, product_id, price in cur.fetchall()}
+
+            items = []
+            for url, (line, target_price) in rows.items():
+                if url not in known:
+                    continue
+                product_id, price = known[url]
+                if price is not None and target_price >= price:
+                    errors.append({"line": line, "url": url,
+                                   "error": "Target price must be less than current price"})
+                    continue
+                items.append((product_id, user_id, target_price))
+
+            if items:
+                execute_values(cur, """
+                INSERT INTO usertrackeditems (usersitemid, userprofileid, target_price) VALUES %s
+                ON CONFLICT (usersitemid, userprofileid)
+                DO UPDATE SET target_price = EXCLUDED.target_price, notified = FALSE
+                """, items, page_size=IMPORT_BATCH_SIZE)
+                cur.execute("UPDATE accounts SET items_updated_at = NOW() WHERE user_id = %s", (user_id,))
+                # New targets can make products more urgent to check.
+                schedule_next_checks(cur, sorted({product_id for product_id, _, _ in items}))
+        conn.commit()
+
+    queued = []
+    unknown = [(url, target_price) for url, (_, target_price) in rows.items() if url not in known]
+    if unknown:
+        job_ids = jobs.enqueue_add_products(user_id, unknown, page_size=IMPORT_BATCH_SIZE)
+        queued = [{"line": rows[url][0], "url": url, "job_id": job_ids[url]} for url, _ in unknown]
+
+    errors.sort(key=lambda e: e["line"])
+    return {"imported": len(items), "queued": queued, "errors": errors}
+
+
+# One batch of tracked products after %(after)s, with the same merged points
+# /price_graph reads: raw change points, their last confirmation and the
+# rollups that replaced pruned raw rows.
+EXPORT_QUERY = f"""
+WITH batch AS (
+    SELECT usersitemid, target_price FROM usertrackeditems
+    WHERE userprofileid = %(user_id)s AND usersitemid > %(after)s
+    ORDER BY usersitemid
+    LIMIT %(limit)s
+),
+{history.points_cte("IN (SELECT usersitemid FROM batch)")}
+SELECT p.product_id, p.product_name, p.product_url, p.current_price, b.target_price,
+       pt.last, pt.t
+FROM batch b
+JOIN products p ON p.product_id = b.usersitemid
+LEFT JOIN points pt ON pt.history_pid = p.product_id
+ORDER BY p.product_id, pt.t;
+"""
+
+
+def export_rows(user_id):
+    """Yields one row per price history point (or per product without history).
+
+    Products are read EXPORT_BATCH_PRODUCTS at a time, keyed on product_id, and
+    the connection goes back to the pool before a batch's rows are yielded.
+    """
+    after = 0
+    while True:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(EXPORT_QUERY, {
+                    "user_id": user_id,
+                    "after": after,
+                    "limit": EXPORT_BATCH_PRODUCTS,
+                    "raw_days": history.HISTORY_RAW_RETENTION_DAYS,
+                    "hourly_days": history.HISTORY_HOURLY_RETENTION_DAYS,
+                })
+                rows = cur.fetchall()
+        if not rows:
+            return
+        yield from rows
+        after = rows[-1][0]
+
+
+def _chunks(rows, render, header=None):
+    buffer = [header] if header else []
+    for row in rows:
+        buffer.append(render(row))
+        if len(buffer) >= EXPORT_CHUNK_ROWS:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+
+def export_csv(user_id):
+    "Yields the export as CSV chunks"
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def render(values):
+        writer.writerow(values)
+        line = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return line
+
+    def render_row(row):
+        return render([v.isoformat() if hasattr(v, "isoformat") else ("" if v is None else v) for v in row])
+
+    return _chunks(export_rows(user_id), render_row, render(EXPORT_COLUMNS))
+
+
+def export_ndjson(user_id):
+    "Yields the export as NDJSON chunks"
+    def render(row):
+        record = dict(zip(EXPORT_COLUMNS, row))
+        for key in ("current_price", "target_price", "recorded_price"):
+            if record[key] is not None:
+                record[key] = float(record[key])
+        if record["recorded_at"] is not None:
+            record["recorded_at"] = record["recorded_at"].isoformat()
+        return json.dumps(record) + "\n"
+    return _chunks(export_rows(user_id), render)
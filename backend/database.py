@@ -1,8 +1,15 @@
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
 import psycopg2
+import psycopg2.extensions
 from psycopg2 import sql, IntegrityError
+from psycopg2.pool import PoolError
 from dotenv import load_dotenv  
 import os
-import scraper as scraper
+import scrape_cache
+from scheduling import schedule_next_checks
 
 load_dotenv()
 
@@ -13,7 +20,15 @@ DB_HOST = os.getenv('DB_HOST')
 DB_PORT = os.getenv('DB_PORT')
 
 
-def get_connection():
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+DB_POOL_CHECK_IDLE = float(os.getenv('DB_POOL_CHECK_IDLE', 30))
+
+
+def connect():
+    "Opens a new, unpooled database connection"
     return psycopg2.connect(
         dbname=DB_NAME,
         user=DB_USER,
@@ -23,15 +38,238 @@ def get_connection():
     )
 
 
-def insert_user_products(user_id, product_url, target_price):
+class PooledConnection:
+    """A checked-out connection that goes back to the pool instead of closing.
+
+    Behaves like a psycopg2 connection: leaving a `with` block commits or rolls
+    back, and additionally returns the connection to the pool. close() does the same.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._conn is not None and not self._conn.closed:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+        return False
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __del__(self):
+        # Don't lose a pool slot if a caller forgets to close the connection.
+        if getattr(self, "_conn", None) is not None:
+            self.close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections with bounded size.
+
+    Connections are health-checked on checkout when they have been idle for a
+    while and are replaced once they exceed max_lifetime seconds.
+    """
+
+    def __init__(self, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE, timeout=DB_POOL_TIMEOUT,
+                 max_lifetime=DB_POOL_MAX_LIFETIME, check_idle=DB_POOL_CHECK_IDLE):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, created_at, returned_at)
+        self._created = {}  # id(conn) -> created_at for checked-out connections
+        self._size = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._checkout_time = 0.0
+        self._max_checkout_time = 0.0
+        self._timeouts = 0
+
+    def _open(self):
+        conn = connect()
+        return conn, time.monotonic()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, created_at, returned_at):
+        now = time.monotonic()
+        if conn.closed or now - created_at > self.max_lifetime:
+            return False
+        if now - returned_at > self.check_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def checkout(self) -> PooledConnection:
+        "Borrows a connection, waiting up to timeout seconds when the pool is exhausted"
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolError(f"No database connection available after {self.timeout}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                else:
+                    conn, created_at, returned_at = None, None, None
+                    self._size += 1
+            finally:
+                self._waiting -= 1
+
+        try:
+            if conn is not None and not self._healthy(conn, created_at, returned_at):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn, created_at = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._created[id(conn)] = created_at
+            self._checkouts += 1
+            self._checkout_time += elapsed
+            self._max_checkout_time = max(self._max_checkout_time, elapsed)
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        "Returns a connection to the pool, discarding it if it is broken or too old"
+        with self._cond:
+            created_at = self._created.pop(id(conn), time.monotonic())
+        keep = not conn.closed and time.monotonic() - created_at <= self.max_lifetime
+        if keep and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                keep = False
+        if not keep:
+            self._discard(conn)
+        with self._cond:
+            if keep:
+                self._idle.append((conn, created_at, time.monotonic()))
+            else:
+                self._size -= 1
+            self._cond.notify()
+
+    def fill(self):
+        "Opens connections until min_size are available"
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn, created_at = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((conn, created_at, time.monotonic()))
+                self._cond.notify()
+
+    def close(self):
+        "Closes every idle connection"
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "max_size": self.max_size,
+                "in_use": self._size - len(self._idle),
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "avg_checkout_ms": round(1000 * self._checkout_time / self._checkouts, 3) if self._checkouts else 0.0,
+                "max_checkout_ms": round(1000 * self._max_checkout_time, 3),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    "Returns the process-wide connection pool"
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+            atexit.register(_pool.close)
+            _pool.fill()
+        return _pool
+
+
+def close_pool():
+    "Closes the process-wide connection pool if it was created"
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_connection():
+    "Checks out a pooled connection; use it in a `with` block or close() it to return it"
+    return get_pool().checkout()
+
+
+def pool_stats() -> dict:
+    "Returns usage statistics for the connection pool"
+    return get_pool().stats()
+
+
+def insert_user_products(user_id, product_url, target_price, product=None):
     """""Inserts a new product into the products table based on product URL, then links to user.
-    Uses INSERT...ON CONFLICT to safely handle multiple concurrent processes."""
+    Uses INSERT...ON CONFLICT to safely handle multiple concurrent processes.
+    Pass an already scraped product to skip the scrape; otherwise the scrape cache is used
+    and scraper.ScrapeError propagates if the scrape fails."""
     
     with get_connection() as conn:
         with conn.cursor() as cur:
             try:
                 # Fetch product data
-                product = scraper.return_dict(product_url)
+                if product is None:
+                    product = scrape_cache.get_product(product_url)
                 
                 # Insert product if new; if it already exists, reuse existing product_id.
                 # Keep current_price fresh on existing rows.
@@ -52,9 +290,25 @@ def insert_user_products(user_id, product_url, target_price):
                     is_new_product = True
                 else:
                     is_new_product = False
-                    cur.execute("SELECT product_id FROM products WHERE product_url = %s", (product["product_url"],))
-                    product_id = cur.fetchone()[0]
-                    cur.execute("UPDATE products SET current_price = %s WHERE product_id = %s", (product["product_price"], product_id))
+                    cur.execute("SELECT product_id, current_price FROM products WHERE product_url = %s", (product["product_url"],))
+                    product_id, old_price = cur.fetchone()
+                    if old_price != product["product_price"]:
+                        # history imports this module, so import it here rather than at the top.
+                        from history import record_price_changes
+
+                        # A cached scrape can be older than the stored price; only a newer one wins.
+                        scraped_at = product.get("scraped_at") or datetime.now(timezone.utc)
+                        cur.execute(
+                            """
+                            UPDATE products SET current_price = %s, price_updated_at = NOW(), history_updated_at = NOW()
+                            WHERE product_id = %s AND current_price IS NOT DISTINCT FROM %s
+                              AND COALESCE(GREATEST(price_updated_at, last_checked_at), '-infinity') < %s
+                            """,
+                            (product["product_price"], product_id, old_price, scraped_at),
+                        )
+                        if cur.rowcount:
+                            # Same bookkeeping as the refresher: target checks and the change point.
+                            record_price_changes(cur, [(product_id, old_price, product["product_price"])])
                 conn.commit()
                 print(f"Product ensured with ID: {product_id}")
                 
@@ -70,6 +324,10 @@ def insert_user_products(user_id, product_url, target_price):
                 )
                 cur.execute(user_tracking_query, (product_id, user_id, target_price))
                 user_item_id = cur.fetchone()[0]
+                cur.execute("UPDATE accounts SET items_updated_at = NOW() WHERE user_id = %s", (user_id,))
+                # A new target can make the product more urgent to check.
+                if not is_new_product:
+                    schedule_next_checks(cur, [product_id])
                 conn.commit()
                 print(f"User item upserted for user {user_id}")
 
@@ -103,5 +361,13 @@ def check_connection() -> bool:
     except Exception as e:
         print(f"Database connection failed: {e}")
         return False
-                
-print(check_connection())
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python database.py check -- explicit connectivity check for deploys and CI
+    if sys.argv[1:] != ["check"]:
+        print("Usage: python database.py check")
+        sys.exit(1)
+    sys.exit(0 if check_connection() else 1)
\ No newline at end of file
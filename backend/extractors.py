@@ -0,0 +1,222 @@
+# extractors.py
+"""HTTP-only product extractors tried before falling back to a browser.
+
+Each extractor takes an ExtractionContext and returns
+{"product_name", "product_price"} or None when it cannot handle the page.
+"""
+import json
+import os
+import re
+import threading
+from decimal import Decimal, InvalidOperation
+from html.parser import HTMLParser
+from urllib.parse import urlsplit, parse_qs
+
+HTTP_FASTPATH = os.getenv('SCRAPER_HTTP_FASTPATH', 'true').lower() != 'false'
+HTTP_TIMEOUT = float(os.getenv('SCRAPER_HTTP_TIMEOUT', 10))
+HTTP_POOL_SIZE = int(os.getenv('SCRAPER_HTTP_POOL_SIZE', 20))
+USER_AGENT = os.getenv(
+    'SCRAPER_USER_AGENT',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+)
+
+# Page statuses that mean the product is gone rather than hidden behind scripts.
+GONE_STATUSES = (404, 410)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    "Returns the shared keep-alive requests.Session"
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers.update({"User-Agent": USER_AGENT})
+        return _session
+
+
+def parse_price(text) -> Decimal:
+    "Turns a display price such as '$1,299.00' into a Decimal"
+    try:
+        return Decimal(re.sub(r'[^\d\.]', '', str(text)))
+    except InvalidOperation:
+        raise ValueError(f"Could not parse price: {text!r}")
+
+
+class ExtractionContext:
+    """Per-URL state shared by the extractors so the page is fetched at most once."""
+
+    def __init__(self, url, session=None):
+        self.url = url
+        self.session = session or get_session()
+        self._html = None
+        self.page_error = None
+
+    def get(self, url, **kwargs):
+        response = self.session.get(url, timeout=HTTP_TIMEOUT, **kwargs)
+        response.raise_for_status()
+        return response
+
+    @property
+    def html(self) -> str:
+        if self.page_error is not None:
+            raise self.page_error
+        if self._html is None:
+            try:
+                self._html = self.get(self.url).text
+            except Exception as e:
+                self.page_error = e
+                raise
+        return self._html
+
+
+def shopify_json(ctx):
+    "Reads /products/<handle>.json, which Shopify stores expose for every product page"
+    parts = urlsplit(ctx.url)
+    match = re.search(r'/products/([^/?#.]+)', parts.path)
+    if not match:
+        return None
+
+    json_url = f"{parts.scheme}://{parts.netloc}/products/{match.group(1)}.json"
+    product = ctx.get(json_url, headers={"Accept": "application/json"}).json()["product"]
+    variants = product.get("variants") or []
+    if not variants:
+        return None
+
+    variant = variants[0]
+    wanted = parse_qs(parts.query).get("variant")
+    if wanted:
+        variant = next((v for v in variants if str(v.get("id")) == wanted[0]), variant)
+
+    return {"product_name": product["title"].strip(), "product_price": parse_price(variant["price"])}
+
+
+def _iter_ld_nodes(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from _iter_ld_nodes(item)
+    elif isinstance(data, dict):
+        yield data
+        if "@graph" in data:
+            yield from _iter_ld_nodes(data["@graph"])
+
+
+def json_ld(ctx):
+    "Reads the schema.org Product block embedded as JSON-LD"
+    for block in re.findall(
+        r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', ctx.html, re.S | re.I
+    ):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        for node in _iter_ld_nodes(data):
+            types = node.get("@type")
+            if types != "Product" and not (isinstance(types, list) and "Product" in types):
+                continue
+            offers = node.get("offers")
+            if isinstance(offers, list):
+                offers = offers[0] if offers else None
+            if not isinstance(offers, dict) or "price" not in offers or not node.get("name"):
+                continue
+            return {"product_name": node["name"].strip(), "product_price": parse_price(offers["price"])}
+    return None
+
+
+class _DawnParser(HTMLParser):
+    """Finds the same elements as scraper.price_selector and scraper.item_selector."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.price = None
+        self.title = None
+        self._capture = None
+        self._buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        classes = set((dict(attrs).get("class") or "").split())
+        in_title = any("product__title" in c for _, c in self.stack)
+        self.stack.append((tag, classes))
+        if self._capture:
+            return
+        if self.price is None and tag == "span" and {"price-item", "price-item--regular"} <= classes:
+            self._start_capture("price")
+        elif self.title is None and tag == "h1" and in_title:
+            self._start_capture("title")
+
+    def handle_endtag(self, tag):
+        while self.stack:
+            open_tag, _ = self.stack.pop()
+            if self._capture and len(self.stack) == self._capture[1]:
+                setattr(self, self._capture[0], "".join(self._buffer).strip())
+                self._capture = None
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._capture:
+            self._buffer.append(data)
+
+    def _start_capture(self, field):
+        self._capture = (field, len(self.stack) - 1)
+        self._buffer = []
+
+
+def dawn_html(ctx):
+    "Reads the Dawn-theme price and title from the static HTML"
+    parser = _DawnParser()
+    parser.feed(ctx.html)
+    if not parser.price or not parser.title:
+        return None
+    return {"product_name": parser.title, "product_price": parse_price(parser.price)}
+
+
+EXTRACTORS = [
+    ("shopify_json", shopify_json),
+    ("json_ld", json_ld),
+    ("dawn_html", dawn_html),
+]
+
+
+def register_extractor(name, fn, position=None):
+    "Adds an extractor; by default it is tried after the built-in ones"
+    entry = (name, fn)
+    if position is None:
+        EXTRACTORS.append(entry)
+    else:
+        EXTRACTORS.insert(position, entry)
+
+
+def extract(url):
+    """Tries every HTTP extractor in order.
+
+    Returns (product, extractor_name), or (None, None) if the browser is needed.
+    Re-raises the page's HTTPError when it answered 404/410, since a browser
+    would not find the product either.
+    """
+    if not HTTP_FASTPATH:
+        return None, None
+
+    ctx = ExtractionContext(url)
+    for name, fn in EXTRACTORS:
+        try:
+            product = fn(ctx)
+        except Exception as e:
+            print(f"Extractor {name} failed for {url}: {e}")
+            continue
+        if product:
+            return product, name
+
+    status = getattr(getattr(ctx.page_error, "response", None), "status_code", None)
+    if status in GONE_STATUSES:
+        raise ctx.page_error
+    return None, None
@@ -0,0 +1,408 @@
+# history.py
+"""Price history storage, rollups and the queries shared by the API routes.
+
+With HISTORY_STORAGE_MODE=changes, price_history keeps one row per price
+change and extends its confirmed_at while the price holds. Older raw rows are
+rolled up into price_history_hourly and price_history_daily and pruned by the
+retention settings (0 days keeps data forever).
+"""
+import os
+
+from psycopg2.extras import execute_values
+
+from database import get_connection
+
+PRICE_GRAPH_MAX_POINTS = int(os.getenv('PRICE_GRAPH_MAX_POINTS', 500))
+RESOLUTIONS = ("raw", "minute", "hour", "day", "week", "month")
+
+HISTORY_STORAGE_MODE = os.getenv('HISTORY_STORAGE_MODE', 'snapshots')
+HISTORY_RAW_RETENTION_DAYS = int(os.getenv('HISTORY_RAW_RETENTION_DAYS', 0))
+HISTORY_HOURLY_RETENTION_DAYS = int(os.getenv('HISTORY_HOURLY_RETENTION_DAYS', 0))
+HISTORY_DAILY_RETENTION_DAYS = int(os.getenv('HISTORY_DAILY_RETENTION_DAYS', 0))
+HISTORY_ROLLUP_LOOKBACK_HOURS = int(os.getenv('HISTORY_ROLLUP_LOOKBACK_HOURS', 48))
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', 500))
+SPARKLINE_POINTS = int(os.getenv('SPARKLINE_POINTS', 30))
+SPARKLINE_DAYS = int(os.getenv('SPARKLINE_DAYS', 30))
+
+
+def _cutoff(days_param):
+    return f"(CASE WHEN %({days_param})s > 0 THEN NOW() - make_interval(days => %({days_param})s) ELSE '-infinity' END)"
+
+
+def points_cte(products):
+    """Returns a `points` CTE with every stored observation of the matching products.
+
+    Rows are (history_pid, t, lo, hi, last): raw change points plus their last
+    confirmation, then rollups for ranges whose raw rows were pruned. Daily
+    buckets only cover ranges where neither raw rows nor hourly buckets are
+    kept. products is an SQL condition on history_pid; the query needs the
+    raw_days and hourly_days parameters.
+    """
+    return f"""
+points AS (
+    SELECT history_pid, time_change AS t, recorded_price AS lo, recorded_price AS hi, recorded_price AS last
+    FROM price_history WHERE history_pid {products}
+    UNION ALL
+    SELECT history_pid, confirmed_at, recorded_price, recorded_price, recorded_price
+    FROM price_history WHERE history_pid {products} AND confirmed_at > time_change
+    UNION ALL
+    SELECT history_pid, last_at, min_price, max_price, last_price
+    FROM price_history_hourly WHERE history_pid {products} AND bucket < {_cutoff("raw_days")}
+    UNION ALL
+    SELECT history_pid, last_at, min_price, max_price, last_price
+    FROM price_history_daily WHERE history_pid {products}
+    AND bucket < LEAST({_cutoff("raw_days")}, {_cutoff("hourly_days")})
+)"""
+
+
+POINTS_CTE = f"""{points_cte("= %(product_id)s")},
+h AS (
+    SELECT * FROM points
+    WHERE t >= COALESCE(%(start)s::timestamptz, '-infinity')
+    AND t <= COALESCE(%(end)s::timestamptz, 'infinity')
+)
+"""
+
+RAW_QUERY = f"""
+WITH {POINTS_CTE}
+SELECT t, lo, hi, last FROM h ORDER BY t ASC;
+"""
+
+# Each bucket reports its last timestamp, min, max and last price so steps
+# and spikes survive downsampling. Buckets with no observation (a price that
+# held across them, e.g. after compaction to change points) are filled with
+# the price held at their start, unless that would exceed fill_limit buckets.
+BUCKETED_QUERY = f"""
+WITH {POINTS_CTE},
+bounds AS (
+    SELECT MIN(t) AS first_t,
+           GREATEST(EXTRACT(EPOCH FROM MAX(t) - MIN(t)) / %(max_points)s, 1) AS width
+    FROM h
+),
+b AS (
+    SELECT {{bucket}} AS k, MAX(t) AS t, MIN(lo) AS lo, MAX(hi) AS hi, (ARRAY_AGG(last ORDER BY t DESC))[1] AS last
+    FROM h, bounds
+    GROUP BY 1
+),
+keys AS (
+    SELECT generate_series(MIN(k), MAX(k), {{step}}) AS k FROM b
+    LIMIT %(fill_limit)s + 1
+),
+filled AS (
+    SELECT keys.k, b.t, b.lo, b.hi, b.last, COUNT(b.k) OVER (ORDER BY keys.k) AS run
+    FROM keys LEFT JOIN b ON b.k = keys.k
+)
+SELECT COALESCE(f.t, {{bucket_start}}), COALESCE(f.lo, f.held), COALESCE(f.hi, f.held), COALESCE(f.last, f.held)
+FROM (SELECT *, FIRST_VALUE(last) OVER (PARTITION BY run ORDER BY k) AS held FROM filled) f, bounds
+WHERE (SELECT COUNT(*) FROM keys) <= %(fill_limit)s
+UNION ALL
+SELECT t, lo, hi, last FROM b
+WHERE (SELECT COUNT(*) FROM keys) > %(fill_limit)s
+ORDER BY 1 ASC;
+"""
+
+CURRENT_PRICE_QUERY = "SELECT NOW(), current_price FROM products WHERE product_id = %s;"
+
+
+def history_version(product_id):
+    "Returns products.history_updated_at, bumped by every history write for the product"
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT history_updated_at FROM products WHERE product_id = %s;", (product_id,))
+            row = cur.fetchone()
+    return row[0] if row else None
+
+
+def price_points(product_id, start=None, end=None, resolution=None, max_points=None):
+    """Returns [(time, min, max, last)] for a product's history.
+
+    resolution is one of RESOLUTIONS and buckets with date_trunc; otherwise the
+    range is split into equal-width buckets so that, counting the current price
+    appended when there is no end, at most max_points are returned. Empty buckets
+    between observations carry the last known price, so snapshot and
+    change-point histories give the same number of points and prices; only
+    the timestamps within a bucket can differ. Filling is skipped when it
+    would produce more than PRICE_GRAPH_MAX_POINTS buckets.
+    """
+    params = {
+        "product_id": product_id,
+        "start": start,
+        "end": end,
+        "raw_days": HISTORY_RAW_RETENTION_DAYS,
+        "hourly_days": HISTORY_HOURLY_RETENTION_DAYS,
+        "fill_limit": PRICE_GRAPH_MAX_POINTS,
+    }
+    limit = None
+    if resolution == "raw":
+        query = RAW_QUERY
+    elif resolution:
+        query = BUCKETED_QUERY.format(bucket="date_trunc(%(resolution)s, t)",
+                                      step="%(step)s::interval", bucket_start="f.k")
+        params["resolution"] = resolution
+        params["step"] = f"1 {resolution}"
+        params["max_points"] = 1
+    else:
+        # The newest point would start a bucket of its own; clamp it into the last one.
+        query = BUCKETED_QUERY.format(
+            bucket="LEAST(FLOOR(EXTRACT(EPOCH FROM t - first_t) / width), %(max_points)s - 1)::int", step="1",
+            bucket_start="first_t + make_interval(secs => (f.k * width)::float8)")
+        limit = max_points or PRICE_GRAPH_MAX_POINTS
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            current = None
+            if end is None:
+                cur.execute(CURRENT_PRICE_QUERY, (product_id,))
+                row = cur.fetchone()
+                if row and row[1] is not None:
+                    current = (row[0], row[1], row[1], row[1])
+            rows = []
+            if limit is not None:
+                # The appended current price counts against the limit.
+                params["max_points"] = limit - 1 if current else limit
+            if params.get("max_points") != 0:
+                cur.execute(query, params)
+                rows = cur.fetchall()
+    if current:
+        rows.append(current)
+    return rows
+
+
+# Recent history for every product a user tracks, cut into a fixed number of
+# equal-width time buckets per product.
+SPARKLINE_QUERY = """
+WITH tracked AS (
+    SELECT usersitemid AS pid FROM usertrackeditems WHERE userprofileid = %(user_id)s
+),
+win AS (
+    SELECT NOW() - make_interval(days => %(days)s) AS lo,
+           %(days)s * 86400.0 / %(points)s AS width
+),
+raw AS (
+    SELECT ph.history_pid AS pid, ph.time_change AS t, ph.recorded_price AS price
+    FROM price_history ph JOIN tracked ON ph.history_pid = tracked.pid
+    WHERE ph.time_change >= (SELECT lo FROM win)
+    UNION ALL
+    SELECT ph.history_pid, ph.confirmed_at, ph.recorded_price
+    FROM price_history ph JOIN tracked ON ph.history_pid = tracked.pid
+    WHERE ph.confirmed_at > ph.time_change AND ph.confirmed_at >= (SELECT lo FROM win)
+)
+SELECT pid, MAX(t) AS t, (ARRAY_AGG(price ORDER BY t DESC))[1]
+FROM raw, win
+GROUP BY pid, LEAST(FLOOR(EXTRACT(EPOCH FROM t - win.lo) / win.width), %(points)s - 1)
+ORDER BY pid, t;
+"""
+
+
+def sparklines(user_id, points=SPARKLINE_POINTS, days=SPARKLINE_DAYS):
+    "Returns {product_id: [(time, price)]} with at most points entries per tracked product"
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SPARKLINE_QUERY, {"user_id": user_id, "points": points, "days": days})
+            rows = cur.fetchall()
+
+    lines = {}
+    for product_id, t, price in rows:
+        lines.setdefault(product_id, []).append((t, price))
+    return lines
+
+
+# Extends the latest change point of each product instead of inserting a snapshot.
+CONFIRM_QUERY = """
+UPDATE price_history ph SET confirmed_at = NOW()
+FROM (
+    SELECT history_pid, MAX(time_change) AS t FROM price_history
+    WHERE history_pid = ANY(%s) GROUP BY history_pid
+) latest
+WHERE ph.history_pid = latest.history_pid AND ph.time_change = latest.t;
+"""
+
+HISTORY_INSERT_QUERY = "INSERT INTO price_history (history_pid, recorded_price) VALUES %s"
+# Queues changed products for the incremental target checks in price_updater.
+PRICE_CHANGE_LOG_QUERY = "INSERT INTO price_changes (product_id, old_price, new_price) VALUES %s"
+
+
+def record_price_changes(cur, changed, storage_mode=HISTORY_STORAGE_MODE):
+    """Records (product_id, old_price, new_price) price changes.
+
+    Every change is queued in price_changes; in "changes" storage mode it also
+    gets its change-point row, so a later CONFIRM_QUERY extends the new price
+    rather than the old one. Snapshot mode writes its history rows separately.
+    """
+    if not changed:
+        return
+    execute_values(cur, PRICE_CHANGE_LOG_QUERY, changed)
+    if storage_mode == "changes":
+        execute_values(cur, HISTORY_INSERT_QUERY, [(pid, new) for pid, _, new in changed])
+
+# Rebuilds hourly buckets from raw points, starting from the last rolled-up
+# bucket (or the oldest raw row) when that is further back than the lookback,
+# so a gap between runs or newly enabled retention loses nothing. Existing
+# buckets are only recomputed while their raw rows are still retained.
+ROLLUP_HOURLY_QUERY = f"""
+WITH win AS (
+    SELECT LEAST(date_trunc('hour', NOW()) - make_interval(hours => %(lookback)s),
+                 COALESCE((SELECT MAX(bucket) FROM price_history_hourly),
+                          (SELECT date_trunc('hour', MIN(time_change)) FROM price_history))) AS lo,
+           date_trunc('hour', NOW()) AS hi
+),
+raw AS (
+    SELECT history_pid, time_change AS t, recorded_price AS price FROM price_history
+    WHERE time_change >= (SELECT lo FROM win) AND time_change < (SELECT hi FROM win)
+    UNION ALL
+    SELECT history_pid, confirmed_at, recorded_price FROM price_history
+    WHERE confirmed_at > time_change
+    AND confirmed_at >= (SELECT lo FROM win) AND confirmed_at < (SELECT hi FROM win)
+)
+INSERT INTO price_history_hourly (history_pid, bucket, min_price, max_price, last_price, last_at, samples)
+SELECT history_pid, date_trunc('hour', t), MIN(price), MAX(price),
+       (ARRAY_AGG(price ORDER BY t DESC))[1], MAX(t), COUNT(*)
+FROM raw
+GROUP BY history_pid, date_trunc('hour', t)
+ON CONFLICT (history_pid, bucket) DO UPDATE SET
+    min_price = EXCLUDED.min_price, max_price = EXCLUDED.max_price, last_price = EXCLUDED.last_price,
+    last_at = EXCLUDED.last_at, samples = EXCLUDED.samples
+WHERE price_history_hourly.bucket > {_cutoff("raw_days")};
+"""
+
+ROLLUP_DAILY_QUERY = f"""
+WITH win AS (
+    SELECT LEAST(date_trunc('day', NOW()) - make_interval(hours => %(lookback)s),
+                 COALESCE((SELECT MAX(bucket) FROM price_history_daily),
+                          (SELECT date_trunc('day', MIN(bucket)) FROM price_history_hourly))) AS lo,
+           date_trunc('day', NOW()) AS hi
+)
+INSERT INTO price_history_daily (history_pid, bucket, min_price, max_price, last_price, last_at, samples)
+SELECT history_pid, date_trunc('day', bucket), MIN(min_price), MAX(max_price),
+       (ARRAY_AGG(last_price ORDER BY last_at DESC))[1], MAX(last_at), SUM(samples)
+FROM price_history_hourly, win
+WHERE bucket >= win.lo AND bucket < win.hi
+GROUP BY history_pid, date_trunc('day', bucket)
+ON CONFLICT (history_pid, bucket) DO UPDATE SET
+    min_price = EXCLUDED.min_price, max_price = EXCLUDED.max_price, last_price = EXCLUDED.last_price,
+    last_at = EXCLUDED.last_at, samples = EXCLUDED.samples
+WHERE price_history_daily.bucket > {_cutoff("hourly_days")};
+"""
+
+# Only rows whose hours (change and last confirmation) are already rolled up
+# are deleted. The newest row of each product is always kept so change points
+# stay anchored.
+PRUNE_RAW_QUERY = f"""
+DELETE FROM price_history WHERE ctid IN (
+    SELECT ph.ctid FROM price_history ph
+    WHERE GREATEST(ph.time_change, ph.confirmed_at) < {_cutoff("raw_days")}
+    AND ph.time_change < (SELECT MAX(time_change) FROM price_history l WHERE l.history_pid = ph.history_pid)
+    AND EXISTS (SELECT 1 FROM price_history_hourly h
+                WHERE h.history_pid = ph.history_pid AND h.bucket = date_trunc('hour', ph.time_change))
+    AND (ph.confirmed_at IS NULL OR EXISTS (
+        SELECT 1 FROM price_history_hourly h
+        WHERE h.history_pid = ph.history_pid AND h.bucket = date_trunc('hour', ph.confirmed_at)))
+    LIMIT %(limit)s
+);
+"""
+
+PRUNE_HOURLY_QUERY = f"""
+DELETE FROM price_history_hourly WHERE ctid IN (
+    SELECT h.ctid FROM price_history_hourly h
+    WHERE h.bucket < {_cutoff("hourly_days")}
+    AND EXISTS (SELECT 1 FROM price_history_daily d
+                WHERE d.history_pid = h.history_pid AND d.bucket = date_trunc('day', h.bucket))
+    LIMIT %(limit)s
+);
+"""
+
+PRUNE_DAILY_QUERY = f"""
+DELETE FROM price_history_daily WHERE ctid IN (
+    SELECT ctid FROM price_history_daily WHERE bucket < {_cutoff("daily_days")} LIMIT %(limit)s
+);
+"""
+
+# Collapses each run of equal consecutive prices into its first row, carrying
+# the run's last timestamp into confirmed_at.
+COMPACT_QUERY = """
+WITH ordered AS (
+    SELECT ctid AS rid, history_pid, time_change, recorded_price,
+           COALESCE(confirmed_at, time_change) AS seen_at,
+           LAG(recorded_price) OVER (PARTITION BY history_pid ORDER BY time_change) AS prev
+    FROM price_history WHERE history_pid = ANY(%s)
+),
+runs AS (
+    SELECT *, SUM(CASE WHEN recorded_price IS DISTINCT FROM prev THEN 1 ELSE 0 END)
+              OVER (PARTITION BY history_pid ORDER BY time_change) AS run
+    FROM ordered
+),
+collapsed AS (
+    SELECT history_pid, run, (ARRAY_AGG(rid ORDER BY time_change))[1] AS keep, MAX(seen_at) AS confirmed
+    FROM runs GROUP BY history_pid, run HAVING COUNT(*) > 1
+),
+confirmed AS (
+    UPDATE price_history ph SET confirmed_at = c.confirmed
+    FROM collapsed c WHERE ph.ctid = c.keep
+)
+DELETE FROM price_history ph
+USING runs r JOIN collapsed c ON r.history_pid = c.history_pid AND r.run = c.run
+WHERE ph.ctid = r.rid AND r.rid <> c.keep;
+"""
+
+
+def maintain_price_history():
+    """Refreshes hourly/daily rollups, then prunes data past its retention in bounded batches."""
+    params = {
+        "raw_days": HISTORY_RAW_RETENTION_DAYS,
+        "hourly_days": HISTORY_HOURLY_RETENTION_DAYS,
+        "daily_days": HISTORY_DAILY_RETENTION_DAYS,
+        "lookback": HISTORY_ROLLUP_LOOKBACK_HOURS,
+        "limit": HISTORY_BATCH_SIZE,
+    }
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(ROLLUP_HOURLY_QUERY, params)
+            hourly = cur.rowcount
+            cur.execute(ROLLUP_DAILY_QUERY, params)
+            daily = cur.rowcount
+        conn.commit()
+        print(f"Rolled up {hourly} hourly and {daily} daily buckets")
+
+        for name, query, days in (
+            ("raw", PRUNE_RAW_QUERY, HISTORY_RAW_RETENTION_DAYS),
+            ("hourly", PRUNE_HOURLY_QUERY, HISTORY_HOURLY_RETENTION_DAYS),
+            ("daily", PRUNE_DAILY_QUERY, HISTORY_DAILY_RETENTION_DAYS),
+        ):
+            if days <= 0:
+                continue
+            deleted = 0
+            with conn.cursor() as cur:
+                while True:
+                    cur.execute(query, params)
+                    conn.commit()
+                    deleted += cur.rowcount
+                    if cur.rowcount < HISTORY_BATCH_SIZE:
+                        break
+            print(f"Pruned {deleted} {name} history rows")
+            if deleted:
+                with conn.cursor() as cur:
+                    cur.execute("UPDATE products SET history_updated_at = NOW();")
+                conn.commit()
+
+
+def compact_price_history(batch_size=HISTORY_BATCH_SIZE):
+    """One-shot migration to change-point storage, one batch of products per transaction."""
+    last_id = 0
+    removed = 0
+    with get_connection() as conn:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT product_id FROM products WHERE product_id > %s ORDER BY product_id LIMIT %s;",
+                    (last_id, batch_size),
+                )
+                product_ids = [row[0] for row in cur.fetchall()]
+                if not product_ids:
+                    break
+                cur.execute(COMPACT_QUERY, (product_ids,))
+                removed += cur.rowcount
+                cur.execute("UPDATE products SET history_updated_at = NOW() WHERE product_id = ANY(%s);", (product_ids,))
+            conn.commit()
+            last_id = product_ids[-1]
+            print(f"Compacted history up to product {last_id}, {removed} rows removed so far")
+    print(f"Compaction finished, {removed} rows removed")
@@ -0,0 +1,84 @@
+# http_cache.py
+"""Conditional GET support for read-heavy JSON routes.
+
+Routes pass a version timestamp that changes whenever their data does
+(products.price_updated_at, products.history_updated_at,
+accounts.items_updated_at). Matching If-None-Match / If-Modified-Since
+requests get a 304, and rendered bodies are kept in a small LRU cache.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import request, jsonify, current_app
+
+HTTP_CACHE_SIZE = int(os.getenv('HTTP_CACHE_SIZE', 1024))
+
+
+class ResponseCache:
+    """LRU of rendered response bodies keyed by (cache key, etag)."""
+
+    def __init__(self, max_size=HTTP_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+response_cache = ResponseCache()
+
+
+def make_etag(cache_key, version) -> str:
+    return hashlib.sha1(f"{cache_key}|{version.isoformat() if version else ''}".encode()).hexdigest()[:20]
+
+
+def _not_modified(etag, version):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and version is not None:
+        return version.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional_json(cache_key, version, render):
+    """Returns a JSON response for render(), or 304 if the client's copy is current.
+
+    cache_key identifies the resource including its query parameters; version is
+    a timezone-aware datetime that changes whenever the resource does.
+    """
+    etag = make_etag(cache_key, version)
+
+    if _not_modified(etag, version):
+        response = current_app.response_class(status=304)
+    else:
+        body = response_cache.get((cache_key, etag))
+        if body is None:
+            body = jsonify(render()).get_data()
+            response_cache.set((cache_key, etag), body)
+        response = current_app.response_class(body, mimetype="application/json")
+
+    response.set_etag(etag, weak=True)
+    if version is not None:
+        response.last_modified = version
+    # Let browsers keep the body but always revalidate it.
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
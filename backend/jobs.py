@@ -0,0 +1,221 @@
+# jobs.py
+"""Postgres-backed queue for add-product scrapes.
+
+/add_product enqueues a row in scrape_jobs and returns immediately; worker
+threads claim rows with FOR UPDATE SKIP LOCKED, so any number of app processes
+(or `python jobs.py`) can share the queue.
+"""
+import os
+import threading
+
+from psycopg2.extras import execute_values
+
+from database import get_connection, insert_user_products
+import scrape_cache
+import scrape_health
+from scraper import ScrapeError
+from throttle import host_of
+
+ADD_PRODUCT_WORKERS = int(os.getenv('ADD_PRODUCT_WORKERS', 2))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))
+# A running job older than this is assumed to belong to a dead worker and is retried.
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', 300))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+# What the user is told for each scraper.ScrapeError kind.
+SCRAPE_ERROR_MESSAGES = {
+    "not_found": "This product page no longer exists",
+    "blocked": "The store refused our request; try again later",
+    "timeout": "The store took too long to respond; try again later",
+    "network": "Could not reach the store",
+    "circuit_open": "The store is not responding right now; try again later",
+    "pool_busy": "We are busy checking other products; try again in a moment",
+}
+DEFAULT_SCRAPE_ERROR_MESSAGE = "Could not read the product price from this URL"
+
+_wakeup = threading.Event()
+
+
+def enqueue_add_product(user_id, product_url, target_price) -> int:
+    "Queues an add-product scrape and returns its job ID"
+    query = """
+    INSERT INTO scrape_jobs (user_id, product_url, target_price)
+    VALUES (%s, %s, %s)
+    RETURNING job_id;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (user_id, product_url, target_price))
+            job_id = cur.fetchone()[0]
+        conn.commit()
+    _wakeup.set()
+    return job_id
+
+
+def enqueue_add_products(user_id, items, page_size=500):
+    """Queues one add-product scrape per (product_url, target_price) in a single transaction.
+
+    Returns {product_url: job_id}.
+    """
+    query = """
+    INSERT INTO scrape_jobs (user_id, product_url, target_price) VALUES %s
+    RETURNING product_url, job_id;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            rows = execute_values(cur, query, [(user_id, url, target) for url, target in items],
+                                  page_size=page_size, fetch=True)
+        conn.commit()
+    _wakeup.set()
+    return dict(rows)
+
+
+def get_job(job_id, user_id):
+    "Returns the job as a dict, or None if it does not exist or belongs to another user"
+    query = """
+    SELECT job_id, status, outcome, message, usersitemid, created_at, finished_at
+    FROM scrape_jobs WHERE job_id = %s AND user_id = %s;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (job_id, user_id))
+            row = cur.fetchone()
+    if not row:
+        return None
+    return {
+        "job_id": row[0],
+        "status": row[1],
+        "outcome": row[2],
+        "message": row[3],
+        "product_id": row[4],
+        "created_at": row[5].isoformat(),
+        "finished_at": row[6].isoformat() if row[6] else None,
+    }
+
+
+def claim_job():
+    "Claims the oldest queued (or abandoned) job, or returns None"
+    query = """
+    UPDATE scrape_jobs SET status = 'running', started_at = NOW(), attempts = attempts + 1
+    WHERE job_id = (
+        SELECT job_id FROM scrape_jobs
+        WHERE status = 'queued'
+           OR (status = 'running' AND started_at < NOW() - make_interval(secs => %s))
+        ORDER BY job_id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING job_id, user_id, product_url, target_price, attempts;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (JOB_STALE_AFTER,))
+            row = cur.fetchone()
+        conn.commit()
+    return row
+
+
+def finish_job(job_id, outcome, message, usersitemid=None):
+    query = """
+    UPDATE scrape_jobs
+    SET status = 'done', outcome = %s, message = %s, usersitemid = %s, finished_at = NOW()
+    WHERE job_id = %s;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (outcome, message, usersitemid, job_id))
+        conn.commit()
+
+
+def run_add_product(job_id, user_id, product_url, target_price, attempts):
+    "Scrapes the product and links it to the user, recording the outcome on the job"
+    if attempts > JOB_MAX_ATTEMPTS:
+        finish_job(job_id, "error", "Gave up after repeated worker failures")
+        return
+
+    domain = host_of(product_url)
+    try:
+        if scrape_health.open_until(domain):
+            raise ScrapeError("circuit_open", f"Circuit breaker open for {domain}")
+        product = scrape_cache.get_product(product_url)
+    except ScrapeError as e:
+        action = "skipped" if e.kind == "circuit_open" else "failed"
+        scrape_health.log_failure(None, product_url, domain, e.kind, action, str(e))
+        scrape_health.record_failure(domain, e.kind)
+        finish_job(job_id, "scrape_failed", SCRAPE_ERROR_MESSAGES.get(e.kind, DEFAULT_SCRAPE_ERROR_MESSAGE))
+        return
+
+    if target_price >= product["product_price"]:
+        finish_job(job_id, "target_too_high", "Target price must be less than current price")
+        return
+
+    usersitemid = insert_user_products(user_id, product_url, target_price, product)
+    if usersitemid is None:
+        finish_job(job_id, "error", "Could not save the product")
+        return
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE usertrackeditems SET notified = FALSE WHERE usersitemid = %s;", (usersitemid,))
+        conn.commit()
+
+    finish_job(job_id, "success", "Product added successfully", usersitemid)
+
+
+def _worker_loop(stop):
+    while not stop.is_set():
+        try:
+            job = claim_job()
+        except Exception as e:
+            print(f"Error claiming job: {e}")
+            job = None
+
+        if job is None:
+            _wakeup.wait(JOB_POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+
+        try:
+            run_add_product(*job)
+        except Exception as e:
+            print(f"Error in add-product job {job[0]}: {e}")
+            try:
+                finish_job(job[0], "error", str(e))
+            except Exception as e:
+                print(f"Error recording job {job[0]}: {e}")
+
+
+_workers = []
+_workers_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def start_workers(count=ADD_PRODUCT_WORKERS):
+    "Starts the background add-product workers once per process"
+    if _workers:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(count):
+            worker = threading.Thread(target=_worker_loop, args=(_stop,), name=f"add-product-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def stop_workers():
+    "Asks the workers to exit after their current job"
+    _stop.set()
+    _wakeup.set()
+    for worker in _workers:
+        worker.join(timeout=30)
+    _workers.clear()
+
+
+if __name__ == "__main__":
+    start_workers()
+    try:
+        for worker in _workers:
+            worker.join()
+    except KeyboardInterrupt:
+        stop_workers()
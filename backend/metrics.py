@@ -0,0 +1,161 @@
+# metrics.py
+"""Timing spans and counters exported in the Prometheus text format.
+
+Disabled unless METRICS_ENABLED=true; span() then returns a shared no-op and
+incr()/observe() return immediately. The app serves GET /metrics and the
+worker adds /metrics next to /health. Batch jobs set METRICS_FILE to have the
+registry written there on exit (e.g. for node_exporter's textfile collector).
+"""
+import atexit
+import functools
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_PREFIX = 'price_tracker_'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_METRIC = 'stage_seconds'
+
+_NOOP = nullcontext()
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by name and label set."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}  # key -> [bucket counts..., sum, count]
+
+    def inc(self, name, amount, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self) -> str:
+        "Returns every metric in the Prometheus text exposition format"
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(values)) for key, values in self._histograms.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {METRICS_PREFIX}{name} counter")
+                typed.add(name)
+            lines.append(f"{METRICS_PREFIX}{name}{_labels(labels)} {value}")
+        for (name, labels), values in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {METRICS_PREFIX}{name} histogram")
+                typed.add(name)
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{METRICS_PREFIX}{name}_bucket{_labels(labels + (('le', str(bound)),))} {count}")
+            lines.append(f"{METRICS_PREFIX}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{METRICS_PREFIX}{name}_sum{_labels(labels)} {values[-2]:.6f}")
+            lines.append(f"{METRICS_PREFIX}{name}_count{_labels(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+registry = Registry()
+
+
+class _Span:
+    __slots__ = ("labels", "started")
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.labels["outcome"] = "error" if exc_type else "ok"
+        registry.observe(STAGE_METRIC, time.perf_counter() - self.started, self.labels)
+        return False
+
+
+def span(stage, **labels):
+    "Times a block as price_tracker_stage_seconds{stage=...}; a no-op when metrics are disabled"
+    if not METRICS_ENABLED:
+        return _NOOP
+    labels["stage"] = stage
+    return _Span(labels)
+
+
+def timed(stage):
+    "Decorator form of span() for whole jobs"
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def incr(name, amount=1, **labels):
+    "Adds amount to the counter price_tracker_<name>"
+    if METRICS_ENABLED:
+        registry.inc(name, amount, labels)
+
+
+def observe(name, value, **labels):
+    "Records value (seconds) in the histogram price_tracker_<name>"
+    if METRICS_ENABLED:
+        registry.observe(name, value, labels)
+
+
+def render() -> str:
+    return registry.render()
+
+
+def write_textfile(path=METRICS_FILE):
+    "Writes the registry to path atomically so a collector never reads a partial file"
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(render())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error writing metrics to {path}: {e}")
+
+
+if METRICS_ENABLED and METRICS_FILE:
+    atexit.register(write_textfile)
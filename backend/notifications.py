@@ -1,10 +1,14 @@
 # notifications.py
-import smtplib
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 import os
 from database import get_connection
+import metrics
 
 load_dotenv()
 
@@ -12,33 +16,125 @@ SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
 SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
 SENDER_EMAIL = os.getenv('SENDER_EMAIL')
 SENDER_PASSWORD = os.getenv('SENDER_PASSWORD')
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', 3))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() != 'false'
 
 
-def send_price_alert(user_email, product_name, target_price, current_price):
-    """Send email notification when price drops to target"""
-    
-    subject = f"Alert: {product_name} dropped to ${current_price}!"
-    
-    body = f"""
-    Great news! {product_name} has dropped to your target price of ${target_price}.
-    Check it out before it runs out!
-    
-    Best regards,
-    Price Tracker Team
-    """
-    
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = user_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-        
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+def build_digest(user_email, items):
+    """Build one email listing every item that reached its target price"""
+    if len(items) == 1:
+        subject = f"Alert: {items[0]['product_name']} dropped to ${items[0]['current_price']}!"
+    else:
+        subject = f"Alert: {len(items)} tracked products dropped to your target price!"
+
+    lines = [
+        f"- {item['product_name']}: now ${item['current_price']} (target ${item['target_price']})\n  {item['product_url']}"
+        for item in items
+    ]
+    body = "Great news! These products have dropped to your target price:\n\n" + "\n".join(lines) + \
+        "\n\nCheck them out before they run out!\n\nBest regards,\nPrice Tracker Team\n"
+
+    msg = MIMEMultipart()
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = user_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+class SMTPSessionPool:
+    """Small pool of logged-in SMTP sessions reused across messages."""
+
+    def __init__(self, size=SMTP_POOL_SIZE, host=SMTP_SERVER, port=SMTP_PORT):
+        self.size = size
+        self.host = host
+        self.port = port
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._sessions = []
+
+    def _open(self):
+        import smtplib
+
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if SMTP_STARTTLS:
             server.starttls()
+        if SENDER_EMAIL and SENDER_PASSWORD:
             server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg)
-        
-        print(f"Email sent to {user_email}")
-    except Exception as e:
-        print(f"Error sending email: {e}")
\ No newline at end of file
+        with self._lock:
+            self._sessions.append(server)
+        return server
+
+    def _discard(self, server):
+        with self._lock:
+            if server in self._sessions:
+                self._sessions.remove(server)
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def send(self, msg):
+        "Sends msg on an idle session, reconnecting once if the server dropped it"
+        import smtplib
+
+        try:
+            server = self._idle.get_nowait()
+        except queue.Empty:
+            server = self._open()
+
+        try:
+            try:
+                server.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self._discard(server)
+                server = self._open()
+                server.send_message(msg)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+            # The server rejected this message; the session itself is still usable.
+            self._idle.put(server)
+            raise
+        except Exception:
+            self._discard(server)
+            raise
+        self._idle.put(server)
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+def send_digests(items):
+    """Group items by user, send one digest per user in parallel.
+
+    items are dicts with userprofileid, email, usersitemid, product_name,
+    product_url, current_price and target_price. Returns {userprofileid: error or None}.
+    """
+    by_user = defaultdict(list)
+    for item in items:
+        by_user[item["userprofileid"]].append(item)
+
+    pool = SMTPSessionPool()
+
+    def deliver(user_items):
+        email = user_items[0]["email"]
+        try:
+            with metrics.span("smtp_send"):
+                pool.send(build_digest(email, user_items))
+            metrics.incr("emails_total", outcome="sent")
+            print(f"Email sent to {email} for {len(user_items)} items")
+            return None
+        except Exception as e:
+            metrics.incr("emails_total", outcome="failed")
+            print(f"Error sending email to {email}: {e}")
+            return str(e) or e.__class__.__name__
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(pool.size, len(by_user)))) as executor:
+            errors = executor.map(deliver, by_user.values())
+            return dict(zip(by_user.keys(), errors))
+    finally:
+        pool.close()
@@ -1,82 +1,287 @@
-from decimal import Decimal
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from database import get_connection
+import metrics
 import scraper as scraper
-from notifications import send_price_alert
+from psycopg2.extras import execute_values
+from notifications import send_digests
+from price_writer import PriceWriter
+import scrape_health
+from history import maintain_price_history, compact_price_history
+from throttle import HostLimiter, host_of
+from scheduling import SCRAPE_BUDGET_PER_HOUR
 
+REFRESH_CONCURRENCY = int(os.getenv('REFRESH_CONCURRENCY', 8))
+REFRESH_PER_HOST = int(os.getenv('REFRESH_PER_HOST', 2))
+REFRESH_HOST_RPS = float(os.getenv('REFRESH_HOST_RPS', 0))
+REFRESH_LEASE_SECONDS = int(os.getenv('REFRESH_LEASE_SECONDS', 600))
+REFRESH_LEASE_BATCH = int(os.getenv('REFRESH_LEASE_BATCH', 50))
+PRICE_CHANGES_RETENTION_DAYS = int(os.getenv('PRICE_CHANGES_RETENTION_DAYS', 7))
+# Products whose scrape found no free browser are retried after this, without a failure.
+POOL_BUSY_RETRY_SECONDS = int(os.getenv('POOL_BUSY_RETRY_SECONDS', 300))
 
-def price_refresher():
-    """Refreshes current prices of all products in the database."""
+
+def _scrape(limiter, open_domains, url):
+    with limiter.slot(url):
+        # The breaker may have opened while this scrape waited for its host slot.
+        if host_of(url) in open_domains:
+            raise scraper.ScrapeError("circuit_open", f"Circuit breaker open for {host_of(url)}")
+        return scraper.return_dict(url)
+
+
+def claim_products(worker_id, limit):
+    """Leases up to limit due products to this worker.
+
+    A product is due once its next_check_at (see scheduling.py) has passed.
+    Rows are picked with FOR UPDATE SKIP LOCKED so concurrent workers never
+    claim the same product; a lease that expires (dead worker) makes the
+    product claimable again. Claims stop once SCRAPE_BUDGET_PER_HOUR products
+    have been checked in the last hour.
+    """
+    query = """
+    UPDATE products p SET lease_owner = %(worker)s,
+        lease_expires_at = NOW() + make_interval(secs => %(lease)s)
+    WHERE p.product_id IN (
+        SELECT product_id FROM products
+        WHERE (lease_expires_at IS NULL OR lease_expires_at < NOW())
+        AND (next_check_at IS NULL OR next_check_at <= NOW())
+        ORDER BY next_check_at NULLS FIRST
+        LIMIT CASE WHEN %(budget)s > 0 THEN LEAST(%(limit)s, GREATEST(%(budget)s - (
+            SELECT COUNT(*) FROM products WHERE last_checked_at > NOW() - INTERVAL '1 hour'
+        ), 0)) ELSE %(limit)s END
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING p.product_id, p.product_url, p.current_price;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, {"worker": worker_id, "lease": REFRESH_LEASE_SECONDS,
+                                "budget": SCRAPE_BUDGET_PER_HOUR, "limit": limit})
+            rows = cur.fetchall()
+        conn.commit()
+    return rows
+
+
+@metrics.timed("refresh_run")
+def price_refresher(stop=None):
+    """Refreshes current prices of all due products in the database.
+
+    Any number of workers can run this at once: each leases batches of due
+    products (claim_products) until none are left. Products are scraped
+    concurrently (REFRESH_CONCURRENCY workers, at most REFRESH_PER_HOST in
+    flight and REFRESH_HOST_RPS requests per second per host) and results are
+    buffered into batched writes as their scrapes complete.
+
+    A failed scrape never stops the run: the product is rescheduled with
+    backoff and the failure counts against its domain's circuit breaker.
+    Products on domains with an open breaker are skipped until it closes.
+
+    Once the optional threading.Event stop is set, no further batches are
+    claimed; scrapes already in flight finish and are written.
+    """
     try:
-        select_query = "SELECT product_url from products;"
-        check_query = "SELECT current_price from products WHERE product_url = %s;"
-        update_query = "UPDATE products SET current_price = %s WHERE product_url = %s;"
-        add_history_query = "INSERT INTO price_history (history_pid, recorded_price) VALUES ((SELECT product_id from products WHERE product_url = %s), %s)"
-        
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(select_query)
-                urls_list = cur.fetchall()
-
-                for (product_urls, ) in urls_list:
-                    new_price = scraper.return_dict(product_urls)["product_price"]
-                    cur.execute(check_query, (product_urls,))
-                    old_price = Decimal(cur.fetchone()[0])
-                    if new_price != old_price:
-                        cur.execute(update_query, (new_price, product_urls))
-                        print(f"Price updated for {product_urls}")
-                    # Always store a price snapshot for charting, even when price is unchanged.
-                    cur.execute(add_history_query, (product_urls, new_price))
-                    conn.commit()
+        worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        limiter = HostLimiter(REFRESH_PER_HOST, REFRESH_HOST_RPS)
+        claimed = 0
+        failed = 0
+        skipped = 0
+        healthy_domains = set()
+        # Shared with the scrape threads, so it is updated in place.
+        open_domains = {}
+
+        with ThreadPoolExecutor(max_workers=REFRESH_CONCURRENCY) as executor, get_connection() as conn:
+            writer = PriceWriter(conn)
+            futures = {}
+            exhausted = False
+
+            while True:
+                # Keep the executor fed without leasing far more than it can work through.
+                if not exhausted and stop is not None and stop.is_set():
+                    print(f"[{worker_id}] Stop requested, finishing the claimed products")
+                    exhausted = True
+                if not exhausted and len(futures) < REFRESH_CONCURRENCY * 2:
+                    with metrics.span("refresh_claim"):
+                        scrape_health.record_successes(healthy_domains)
+                        healthy_domains.clear()
+                        current = scrape_health.open_domains()
+                        open_domains.clear()
+                        open_domains.update(current)
+                        batch = claim_products(worker_id, REFRESH_LEASE_BATCH)
+                    exhausted = not batch
+                    claimed += len(batch)
+                    for product_id, url, old_price in batch:
+                        domain = host_of(url)
+                        if domain in open_domains:
+                            skipped += 1
+                            metrics.incr("refresh_products_total", domain=domain, outcome="skipped")
+                            writer.skip(product_id, url, "circuit_open", open_domains[domain])
+                            continue
+                        futures[executor.submit(_scrape, limiter, open_domains, url)] = (product_id, url, old_price)
+
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    product_id, product_url, old_price = futures.pop(future)
+                    domain = host_of(product_url)
+                    try:
+                        product = future.result()
+                    except scraper.ScrapeError as e:
+                        if e.kind == "circuit_open":
+                            skipped += 1
+                            metrics.incr("refresh_products_total", domain=domain, outcome="skipped")
+                            until = open_domains.get(domain) or datetime.now(timezone.utc)
+                            writer.skip(product_id, product_url, e.kind, until)
+                            continue
+                        if e.kind == "pool_busy":
+                            skipped += 1
+                            metrics.incr("refresh_products_total", domain=domain, outcome="skipped")
+                            until = datetime.now(timezone.utc) + timedelta(seconds=POOL_BUSY_RETRY_SECONDS)
+                            writer.skip(product_id, product_url, e.kind, until)
+                            continue
+                        failed += 1
+                        metrics.incr("refresh_products_total", domain=domain, outcome="failed")
+                        writer.fail(product_id, product_url, e)
+                        until = scrape_health.record_failure(domain, e.kind)
+                        if until is not None and domain not in open_domains:
+                            open_domains[domain] = until
+                            print(f"Circuit breaker opened for {domain} until {until.isoformat()}")
+                        continue
+                    healthy_domains.add(domain)
+                    metrics.incr("refresh_products_total", domain=domain, outcome="ok")
+                    writer.add(product_id, old_price, product["product_price"])
+
+            writer.flush()
+            scrape_health.record_successes(healthy_domains)
+
+        scrape_health.purge_failures()
+        print(f"[{worker_id}] Refreshed {writer.written} of {claimed} products, "
+              f"{writer.changed} price changes, {failed} failed, {skipped} skipped")
     except Exception as e:
         print(f"Error in price_refresher: {e}")
         raise
 
 
-def check_and_notify_targets():
-    """Check for products that hit target prices and notify users."""
+def _consume_price_changes(cur, flag):
+    "Marks pending price_changes rows as handled for one consumer and returns their product IDs"
+    cur.execute(
+        f"UPDATE price_changes SET {flag} = TRUE WHERE {flag} = FALSE RETURNING product_id;"
+    )
+    return sorted({row[0] for row in cur.fetchall()})
+
+
+@metrics.timed("notify_run")
+def check_and_notify_targets(full=False):
+    """Check for products that hit target prices and notify users.
+
+    Only products whose price changed since the last run (price_changes) are
+    evaluated unless full is set. Due alerts are claimed in one statement, sent
+    as one digest per user, and every item's delivery result is recorded. Items
+    whose digest failed are released and re-queued so the next run retries them.
+    """
     try:
-        query = """
-        SELECT u.email, p.product_url, p.current_price, ut.target_price, p.product_name, ut.userprofileid
-        FROM usertrackeditems ut
-        JOIN products p ON ut.usersitemid = p.product_id
-        JOIN accounts u ON ut.userprofileid = u.user_id
-        WHERE p.current_price <= ut.target_price AND ut.notified = FALSE;
+        claim_query = """
+        UPDATE usertrackeditems ut SET notified = TRUE
+        FROM products p, accounts u
+        WHERE ut.usersitemid = p.product_id AND ut.userprofileid = u.user_id
+        AND p.current_price <= ut.target_price AND ut.notified = FALSE
+        AND (%(full)s OR ut.usersitemid = ANY(%(product_ids)s))
+        RETURNING ut.userprofileid, u.email, ut.usersitemid, p.product_name, p.product_url,
+                  p.current_price, ut.target_price;
         """
-        
-        update_query = "UPDATE usertrackeditems SET notified = TRUE WHERE userprofileid = %s;"
-        
+        release_query = """
+        UPDATE usertrackeditems ut SET notified = FALSE
+        FROM (VALUES %s) AS f(usersitemid, userprofileid)
+        WHERE ut.usersitemid = f.usersitemid AND ut.userprofileid = f.userprofileid;
+        """
+        requeue_query = """
+        INSERT INTO price_changes (product_id, old_price, new_price, resets_checked)
+        SELECT product_id, current_price, current_price, TRUE FROM products WHERE product_id = ANY(%s);
+        """
+        record_query = """
+        INSERT INTO notification_deliveries
+            (userprofileid, usersitemid, current_price, target_price, status, error)
+        VALUES %s
+        """
+        columns = ("userprofileid", "email", "usersitemid", "product_name", "product_url",
+                   "current_price", "target_price")
+
         with get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(query)
-                results = cur.fetchall()
-                
-                for email, product_url, current_price, target_price, product_name, userprofileid in results:
-                    send_price_alert(email, product_name, target_price, current_price)
-                    
-                    cur.execute(update_query, (userprofileid,))
-                    conn.commit()
-                    print(f"Notification sent to {email} for {product_name}")
+                product_ids = _consume_price_changes(cur, "targets_checked")
+                if full or product_ids:
+                    with metrics.span("notify_claim"):
+                        cur.execute(claim_query, {"full": full, "product_ids": product_ids})
+                        items = [dict(zip(columns, row)) for row in cur.fetchall()]
+                else:
+                    items = []
+            conn.commit()
+
+        if not items:
+            print("No targets reached")
+            return
+
+        with metrics.span("smtp"):
+            errors = send_digests(items)
+
+        deliveries = [
+            (item["userprofileid"], item["usersitemid"], item["current_price"], item["target_price"],
+             "failed" if errors[item["userprofileid"]] else "sent", errors[item["userprofileid"]])
+            for item in items
+        ]
+        failed = [(item["usersitemid"], item["userprofileid"]) for item in items if errors[item["userprofileid"]]]
+
+        with metrics.span("notify_record"), get_connection() as conn:
+            with conn.cursor() as cur:
+                if failed:
+                    execute_values(cur, release_query, failed)
+                    cur.execute(requeue_query, (sorted({pid for pid, _ in failed}),))
+                execute_values(cur, record_query, deliveries)
+            conn.commit()
+
+        print(f"Notified {len(items) - len(failed)} items for {sum(1 for e in errors.values() if not e)} users, "
+              f"{len(failed)} items failed")
     except Exception as e:
         print(f"Error in check_and_notify_targets: {e}")
         raise
 
 
-def reset_notified_prices():
-    """Reset notified flag if price went up above target."""
+@metrics.timed("reset_run")
+def reset_notified_prices(full=False):
+    """Reset notified flag if price went up above target.
+
+    Only products whose price changed since the last run are evaluated unless
+    full is set. Handled price_changes rows older than PRICE_CHANGES_RETENTION_DAYS
+    are purged.
+    """
     try:
         query = """
-        UPDATE usertrackeditems SET notified = FALSE WHERE notified = TRUE 
-        AND target_price < (
-            SELECT current_price FROM products 
-            WHERE products.product_id = usertrackeditems.usersitemid
-        );
+        UPDATE usertrackeditems ut SET notified = FALSE
+        FROM products p
+        WHERE p.product_id = ut.usersitemid
+        AND ut.notified = TRUE AND ut.target_price < p.current_price
+        AND (%(full)s OR ut.usersitemid = ANY(%(product_ids)s));
+        """
+        purge_query = """
+        DELETE FROM price_changes
+        WHERE targets_checked AND resets_checked
+        AND changed_at < NOW() - make_interval(days => %s);
         """
         
         with get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(query)
+                product_ids = _consume_price_changes(cur, "resets_checked")
+                reset = 0
+                if full or product_ids:
+                    cur.execute(query, {"full": full, "product_ids": product_ids})
+                    reset = cur.rowcount
+                cur.execute(purge_query, (PRICE_CHANGES_RETENTION_DAYS,))
                 conn.commit()
-                print(f"Reset {cur.rowcount} items")
+                print(f"Reset {reset} items")
     except Exception as e:
         print(f"Error in reset_notified_prices: {e}")
         raise
@@ -89,6 +294,10 @@ if __name__ == "__main__":
         "price_refresher": price_refresher,
         "check_and_notify_targets": check_and_notify_targets,
         "reset_notified_prices": reset_notified_prices,
+        "check_all_targets": lambda: check_and_notify_targets(full=True),
+        "reset_all_notified": lambda: reset_notified_prices(full=True),
+        "maintain_price_history": maintain_price_history,
+        "compact_price_history": compact_price_history,
     }
     
     if len(sys.argv) < 2:
@@ -0,0 +1,138 @@
+# price_writer.py
+import os
+import time
+from decimal import Decimal
+from psycopg2.extras import execute_values
+import metrics
+from history import HISTORY_STORAGE_MODE, HISTORY_INSERT_QUERY, CONFIRM_QUERY, record_price_changes
+from scheduling import (schedule_next_checks, SCHEDULE_MIN_INTERVAL, QUARANTINE_AFTER_FAILURES,
+                        QUARANTINE_MAX_INTERVAL)
+from scrape_health import log_failures
+from throttle import host_of
+
+REFRESH_BATCH_SIZE = int(os.getenv('REFRESH_BATCH_SIZE', 200))
+REFRESH_COMMIT_INTERVAL = float(os.getenv('REFRESH_COMMIT_INTERVAL', 10))
+
+
+class PriceWriter:
+    """Buffers scraped prices and writes them with set-based statements.
+
+    Rows are flushed once batch_size results are buffered, and the transaction
+    is committed at least every commit_interval seconds. In "changes" storage
+    mode only price changes get a history row; unchanged prices extend the
+    confirmed_at of the product's latest row. Failed and skipped products are
+    rescheduled and logged to scrape_failures.
+    """
+
+    # Every written product gets a new history version; price_updated_at only
+    # moves when the price does (see http_cache).
+    update_query = """
+    UPDATE products p SET
+        current_price = v.price,
+        price_updated_at = CASE WHEN p.current_price IS DISTINCT FROM v.price THEN NOW() ELSE p.price_updated_at END,
+        history_updated_at = NOW(),
+        last_checked_at = NOW(),
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        failure_count = 0,
+        last_failure_kind = NULL
+    FROM (VALUES %s) AS v(product_id, price)
+    WHERE p.product_id = v.product_id;
+    """
+    # Failed scrapes still count as checked. They are retried after the minimum
+    # interval, backing off exponentially once a product keeps failing (scheduling.py).
+    release_query = """
+    UPDATE products p SET last_checked_at = NOW(), lease_owner = NULL, lease_expires_at = NULL,
+        failure_count = p.failure_count + 1,
+        last_failure_kind = v.kind,
+        next_check_at = NOW() + make_interval(secs => LEAST(
+            %(min_interval)s * POWER(2, GREATEST(p.failure_count + 2 - %(quarantine_after)s, 0)),
+            %(max_interval)s))
+    FROM unnest(%(product_ids)s::integer[], %(kinds)s::text[]) AS v(product_id, kind)
+    WHERE p.product_id = v.product_id;
+    """
+    # Skipped products (open circuit breaker) wait for the breaker without counting as checked.
+    skip_query = """
+    UPDATE products p SET lease_owner = NULL, lease_expires_at = NULL, next_check_at = v.until
+    FROM unnest(%s::integer[], %s::timestamptz[]) AS v(product_id, until)
+    WHERE p.product_id = v.product_id;
+    """
+
+    def __init__(self, conn, batch_size=REFRESH_BATCH_SIZE, commit_interval=REFRESH_COMMIT_INTERVAL,
+                 storage_mode=HISTORY_STORAGE_MODE):
+        self.conn = conn
+        self.storage_mode = storage_mode
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.pending = []
+        self.failed = []
+        self.skipped = []
+        self.written = 0
+        self.changed = 0
+        self._last_commit = time.monotonic()
+
+    def add(self, product_id, old_price, new_price):
+        "Buffers one scraped price; flushes when the batch is full"
+        self.pending.append((product_id, Decimal(old_price), new_price))
+        self._maybe_flush()
+
+    def fail(self, product_id, product_url, error):
+        "Buffers a product whose scrape failed with a scraper.ScrapeError"
+        self.failed.append((product_id, product_url, error.kind, str(error)))
+        self._maybe_flush()
+
+    def skip(self, product_id, product_url, reason, until):
+        "Buffers a product that was not scraped; it becomes due again at until"
+        self.skipped.append((product_id, product_url, reason, until))
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self.pending) + len(self.failed) + len(self.skipped) >= self.batch_size:
+            self.flush()
+        elif time.monotonic() - self._last_commit >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        "Writes every buffered price and commits"
+        with metrics.span("db_write"):
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            changed = [(pid, old, new) for pid, old, new in self.pending if new != old]
+            with self.conn.cursor() as cur:
+                execute_values(cur, self.update_query, [(pid, new) for pid, _, new in self.pending],
+                               template="(%s, %s::numeric)")
+                record_price_changes(cur, changed, self.storage_mode)
+                if self.storage_mode == "changes":
+                    unchanged = [pid for pid, old, new in self.pending if new == old]
+                    if unchanged:
+                        cur.execute(CONFIRM_QUERY, (unchanged,))
+                else:
+                    # Always store a price snapshot for charting, even when price is unchanged.
+                    execute_values(cur, HISTORY_INSERT_QUERY, [(pid, new) for pid, _, new in self.pending])
+                schedule_next_checks(cur, [pid for pid, _, _ in self.pending])
+            self.written += len(self.pending)
+            self.changed += len(changed)
+            self.pending = []
+        if self.failed or self.skipped:
+            with self.conn.cursor() as cur:
+                if self.failed:
+                    cur.execute(self.release_query, {
+                        "product_ids": [pid for pid, _, _, _ in self.failed],
+                        "kinds": [kind for _, _, kind, _ in self.failed],
+                        "min_interval": SCHEDULE_MIN_INTERVAL,
+                        "quarantine_after": QUARANTINE_AFTER_FAILURES,
+                        "max_interval": QUARANTINE_MAX_INTERVAL,
+                    })
+                if self.skipped:
+                    cur.execute(self.skip_query, ([pid for pid, _, _, _ in self.skipped],
+                                                  [until for _, _, _, until in self.skipped]))
+                log_failures(cur, [(pid, url, host_of(url), kind, "failed", message)
+                                   for pid, url, kind, message in self.failed] +
+                                  [(pid, url, host_of(url), reason, "skipped", f"Skipped until {until.isoformat()}")
+                                   for pid, url, reason, until in self.skipped])
+            self.failed = []
+            self.skipped = []
+        self.conn.commit()
+        self._last_commit = time.monotonic()
@@ -0,0 +1,74 @@
+# scheduling.py
+"""Adaptive refresh scheduling.
+
+After each check a product gets a next_check_at between SCHEDULE_MIN_INTERVAL
+and SCHEDULE_MAX_INTERVAL seconds away. The interval shrinks when the price has
+been volatile, when it is close to the lowest active target, and when many
+users track the product. price_updater only claims products that are due, and
+never more than SCRAPE_BUDGET_PER_HOUR per hour (0 disables the budget).
+
+Failed products are retried after SCHEDULE_MIN_INTERVAL; from the
+QUARANTINE_AFTER_FAILURES-th consecutive failure on, the delay doubles with
+every further failure, up to QUARANTINE_MAX_INTERVAL.
+"""
+import os
+
+SCHEDULE_MIN_INTERVAL = int(os.getenv('SCHEDULE_MIN_INTERVAL', 900))
+SCHEDULE_MAX_INTERVAL = int(os.getenv('SCHEDULE_MAX_INTERVAL', 6 * 3600))
+SCHEDULE_VOLATILITY_DAYS = int(os.getenv('SCHEDULE_VOLATILITY_DAYS', 14))
+# A coefficient of variation of 1/weight halves the interval.
+SCHEDULE_VOLATILITY_WEIGHT = float(os.getenv('SCHEDULE_VOLATILITY_WEIGHT', 50))
+# Relative gap to the lowest target below which checks speed up (0.2 = within 20%).
+SCHEDULE_PROXIMITY_BAND = float(os.getenv('SCHEDULE_PROXIMITY_BAND', 0.2))
+SCHEDULE_POPULARITY_WEIGHT = float(os.getenv('SCHEDULE_POPULARITY_WEIGHT', 0.25))
+SCRAPE_BUDGET_PER_HOUR = int(os.getenv('SCRAPE_BUDGET_PER_HOUR', 0))
+QUARANTINE_AFTER_FAILURES = int(os.getenv('QUARANTINE_AFTER_FAILURES', 3))
+QUARANTINE_MAX_INTERVAL = int(os.getenv('QUARANTINE_MAX_INTERVAL', 7 * 86400))
+
+SCHEDULE_QUERY = """
+WITH stats AS (
+    SELECT p.product_id,
+           p.current_price,
+           (SELECT COALESCE(STDDEV_SAMP(ph.recorded_price) / NULLIF(AVG(ph.recorded_price), 0), 0)
+            FROM price_history ph
+            WHERE ph.history_pid = p.product_id
+            AND ph.time_change > NOW() - make_interval(days => %(volatility_days)s)) AS cv,
+           (SELECT MIN(ut.target_price) FROM usertrackeditems ut
+            WHERE ut.usersitemid = p.product_id AND NOT ut.notified) AS min_target,
+           (SELECT COUNT(*) FROM usertrackeditems ut WHERE ut.usersitemid = p.product_id) AS trackers
+    FROM products p
+    WHERE p.product_id = ANY(%(product_ids)s)
+),
+factors AS (
+    SELECT product_id,
+           1 / (1 + cv * %(volatility_weight)s) AS volatility,
+           CASE
+               WHEN min_target IS NULL OR current_price IS NULL OR current_price <= 0 THEN 1
+               ELSE LEAST(GREATEST((current_price - min_target) / current_price / %(proximity_band)s, 0), 1)
+           END AS proximity,
+           CASE WHEN trackers = 0 THEN 1
+                ELSE 1 / (1 + LN(1 + trackers) * %(popularity_weight)s) END AS popularity
+    FROM stats
+)
+UPDATE products p
+SET next_check_at = NOW() + make_interval(secs => LEAST(GREATEST(
+        %(max_interval)s * f.volatility * f.proximity * f.popularity,
+        %(min_interval)s), %(max_interval)s)::double precision)
+FROM factors f
+WHERE p.product_id = f.product_id;
+"""
+
+
+def schedule_next_checks(cur, product_ids):
+    "Sets next_check_at for the given products from their volatility, target gap and popularity"
+    if not product_ids:
+        return
+    cur.execute(SCHEDULE_QUERY, {
+        "product_ids": list(product_ids),
+        "volatility_days": SCHEDULE_VOLATILITY_DAYS,
+        "volatility_weight": SCHEDULE_VOLATILITY_WEIGHT,
+        "proximity_band": SCHEDULE_PROXIMITY_BAND,
+        "popularity_weight": SCHEDULE_POPULARITY_WEIGHT,
+        "min_interval": SCHEDULE_MIN_INTERVAL,
+        "max_interval": SCHEDULE_MAX_INTERVAL,
+    })
@@ -0,0 +1,183 @@
+# schema.py
+"""Idempotent DDL for the tables and indexes the backend relies on.
+
+Run `python schema.py` to apply it; every statement is safe to re-run.
+"""
+from database import get_connection
+
+SCHEMA_STATEMENTS = [
+    # Core tables (already present in deployed databases).
+    """
+    CREATE TABLE IF NOT EXISTS accounts (
+        user_id SERIAL PRIMARY KEY,
+        username VARCHAR(50) UNIQUE NOT NULL,
+        hash_password TEXT NOT NULL,
+        email TEXT NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        product_id SERIAL PRIMARY KEY,
+        product_url TEXT UNIQUE NOT NULL,
+        product_name TEXT,
+        current_price NUMERIC(10, 2)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS usertrackeditems (
+        usersitemid INTEGER NOT NULL REFERENCES products (product_id) ON DELETE CASCADE,
+        userprofileid INTEGER NOT NULL REFERENCES accounts (user_id) ON DELETE CASCADE,
+        target_price NUMERIC(10, 2) NOT NULL,
+        notified BOOLEAN NOT NULL DEFAULT FALSE,
+        PRIMARY KEY (usersitemid, userprofileid)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS price_history (
+        history_pid INTEGER NOT NULL REFERENCES products (product_id) ON DELETE CASCADE,
+        recorded_price NUMERIC(10, 2) NOT NULL,
+        time_change TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    # Shared scrape cache (scrape_cache.py, SCRAPE_CACHE_BACKEND=postgres).
+    """
+    CREATE UNLOGGED TABLE IF NOT EXISTS scrape_cache (
+        url_key TEXT PRIMARY KEY,
+        product_url TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        product_price NUMERIC(10, 2) NOT NULL,
+        source TEXT,
+        scraped_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    # Background add-product jobs (jobs.py).
+    """
+    CREATE TABLE IF NOT EXISTS scrape_jobs (
+        job_id BIGSERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES accounts (user_id) ON DELETE CASCADE,
+        product_url TEXT NOT NULL,
+        target_price NUMERIC(10, 2) NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        outcome TEXT,
+        message TEXT,
+        usersitemid INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        started_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS scrape_jobs_pending_idx ON scrape_jobs (job_id) WHERE status IN ('queued', 'running');",
+    # Per-item alert delivery results (price_updater.check_and_notify_targets).
+    """
+    CREATE TABLE IF NOT EXISTS notification_deliveries (
+        delivery_id BIGSERIAL PRIMARY KEY,
+        userprofileid INTEGER NOT NULL,
+        usersitemid INTEGER NOT NULL,
+        current_price NUMERIC(10, 2),
+        target_price NUMERIC(10, 2),
+        status TEXT NOT NULL,
+        error TEXT,
+        attempted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS notification_deliveries_user_idx ON notification_deliveries (userprofileid, attempted_at);",
+    # Change log consumed by the incremental target checks (price_updater).
+    """
+    CREATE TABLE IF NOT EXISTS price_changes (
+        change_id BIGSERIAL PRIMARY KEY,
+        product_id INTEGER NOT NULL REFERENCES products (product_id) ON DELETE CASCADE,
+        old_price NUMERIC(10, 2),
+        new_price NUMERIC(10, 2) NOT NULL,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        targets_checked BOOLEAN NOT NULL DEFAULT FALSE,
+        resets_checked BOOLEAN NOT NULL DEFAULT FALSE
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS price_changes_targets_idx ON price_changes (change_id) WHERE NOT targets_checked;",
+    "CREATE INDEX IF NOT EXISTS price_changes_resets_idx ON price_changes (change_id) WHERE NOT resets_checked;",
+    "CREATE INDEX IF NOT EXISTS usertrackeditems_item_notified_idx ON usertrackeditems (usersitemid, notified);",
+    "CREATE INDEX IF NOT EXISTS price_history_pid_time_idx ON price_history (history_pid, time_change);",
+    # Change-point storage and rollups (history.py).
+    "ALTER TABLE price_history ADD COLUMN IF NOT EXISTS confirmed_at TIMESTAMPTZ;",
+    "CREATE INDEX IF NOT EXISTS price_history_time_brin ON price_history USING BRIN (time_change);",
+    """
+    CREATE TABLE IF NOT EXISTS price_history_hourly (
+        history_pid INTEGER NOT NULL REFERENCES products (product_id) ON DELETE CASCADE,
+        bucket TIMESTAMPTZ NOT NULL,
+        min_price NUMERIC(10, 2) NOT NULL,
+        max_price NUMERIC(10, 2) NOT NULL,
+        last_price NUMERIC(10, 2) NOT NULL,
+        last_at TIMESTAMPTZ NOT NULL,
+        samples INTEGER NOT NULL,
+        PRIMARY KEY (history_pid, bucket)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS price_history_daily (
+        history_pid INTEGER NOT NULL REFERENCES products (product_id) ON DELETE CASCADE,
+        bucket TIMESTAMPTZ NOT NULL,
+        min_price NUMERIC(10, 2) NOT NULL,
+        max_price NUMERIC(10, 2) NOT NULL,
+        last_price NUMERIC(10, 2) NOT NULL,
+        last_at TIMESTAMPTZ NOT NULL,
+        samples INTEGER NOT NULL,
+        PRIMARY KEY (history_pid, bucket)
+    );
+    """,
+    # Validators for conditional GETs (http_cache.py).
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS price_updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS history_updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
+    "ALTER TABLE accounts ADD COLUMN IF NOT EXISTS items_updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();",
+    # Refresh leases shared by concurrent refresher workers (price_updater.claim_products).
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS last_checked_at TIMESTAMPTZ;",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS lease_owner TEXT;",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;",
+    "CREATE INDEX IF NOT EXISTS products_last_checked_idx ON products (last_checked_at NULLS FIRST);",
+    # Adaptive refresh scheduling (scheduling.py).
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS next_check_at TIMESTAMPTZ;",
+    "CREATE INDEX IF NOT EXISTS products_next_check_idx ON products (next_check_at NULLS FIRST);",
+    # Failure quarantine, circuit breakers and the failure log (scrape_health.py).
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS failure_count INTEGER NOT NULL DEFAULT 0;",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS last_failure_kind TEXT;",
+    """
+    CREATE TABLE IF NOT EXISTS domain_health (
+        domain TEXT PRIMARY KEY,
+        consecutive_failures INTEGER NOT NULL DEFAULT 0,
+        times_opened INTEGER NOT NULL DEFAULT 0,
+        opened_until TIMESTAMPTZ,
+        last_failure_kind TEXT,
+        last_failure_at TIMESTAMPTZ,
+        last_success_at TIMESTAMPTZ
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS scrape_failures (
+        failure_id BIGSERIAL PRIMARY KEY,
+        product_id INTEGER REFERENCES products (product_id) ON DELETE CASCADE,
+        product_url TEXT NOT NULL,
+        domain TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        action TEXT NOT NULL,
+        message TEXT,
+        occurred_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS scrape_failures_product_idx ON scrape_failures (product_id, occurred_at);",
+    "CREATE INDEX IF NOT EXISTS scrape_failures_domain_idx ON scrape_failures (domain, occurred_at);",
+    "CREATE INDEX IF NOT EXISTS scrape_failures_time_idx ON scrape_failures (occurred_at);",
+]
+
+
+def apply_schema():
+    "Creates any missing tables and indexes"
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for statement in SCHEMA_STATEMENTS:
+                cur.execute(statement)
+        conn.commit()
+    print(f"Applied {len(SCHEMA_STATEMENTS)} schema statements")
+
+
+if __name__ == "__main__":
+    apply_schema()
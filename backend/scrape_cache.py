@@ -0,0 +1,178 @@
+# scrape_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import scraper as scraper
+
+SCRAPE_CACHE_TTL = float(os.getenv('SCRAPE_CACHE_TTL', 300))
+SCRAPE_CACHE_SIZE = int(os.getenv('SCRAPE_CACHE_SIZE', 1024))
+# How long a page that answered 404/410 is remembered as gone (0 disables).
+SCRAPE_CACHE_GONE_TTL = float(os.getenv('SCRAPE_CACHE_GONE_TTL', 600))
+# "memory" keeps entries per process; "postgres" also shares them between app workers.
+SCRAPE_CACHE_BACKEND = os.getenv('SCRAPE_CACHE_BACKEND', 'memory')
+
+# Query params dropped from the cache key: anything starting with utm_, plus these exact names.
+TRACKING_PREFIXES = ("utm_",)
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid",
+                             "_pos", "_sid", "_ss", "ref", "ref_"})
+
+
+def is_tracking_param(name) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url) -> str:
+    "Canonical cache key: lowercase scheme/host, no fragment, tracking params or trailing slash"
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not is_tracking_param(k)
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+
+class ScrapeCache:
+    """In-process TTL + LRU cache of scrape results keyed by normalized URL."""
+
+    def __init__(self, ttl=SCRAPE_CACHE_TTL, max_size=SCRAPE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, product = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(product)
+
+    def set(self, key, product):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), dict(product))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class PostgresScrapeCache:
+    """Shared cache stored in the scrape_cache table (see schema.py)."""
+
+    def __init__(self, ttl=SCRAPE_CACHE_TTL):
+        self.ttl = ttl
+
+    def get(self, key):
+        from database import get_connection
+
+        query = """
+        SELECT product_url, product_name, product_price, source, scraped_at FROM scrape_cache
+        WHERE url_key = %s AND scraped_at > NOW() - make_interval(secs => %s);
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (key, self.ttl))
+                row = cur.fetchone()
+        if not row:
+            return None
+        return {"product_url": row[0], "product_name": row[1], "product_price": row[2], "source": row[3],
+                "scraped_at": row[4]}
+
+    def set(self, key, product):
+        from database import get_connection
+
+        query = """
+        INSERT INTO scrape_cache (url_key, product_url, product_name, product_price, source, scraped_at)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (url_key) DO UPDATE SET
+            product_url = EXCLUDED.product_url,
+            product_name = EXCLUDED.product_name,
+            product_price = EXCLUDED.product_price,
+            source = EXCLUDED.source,
+            scraped_at = EXCLUDED.scraped_at;
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (key, product["product_url"], product["product_name"],
+                                    product["product_price"], product.get("source"), product["scraped_at"]))
+            conn.commit()
+
+    def invalidate(self, key):
+        from database import get_connection
+
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM scrape_cache WHERE url_key = %s;", (key,))
+            conn.commit()
+
+
+_local = ScrapeCache()
+_gone = ScrapeCache(ttl=SCRAPE_CACHE_GONE_TTL)
+_shared = PostgresScrapeCache() if SCRAPE_CACHE_BACKEND == 'postgres' else None
+
+
+def get_product(url):
+    """Returns scraper.return_dict(url), reusing a result scraped within the TTL.
+
+    The product carries the caller's own product_url and a scraped_at timestamp,
+    so a cached result can be told apart from a newer price already stored.
+
+    Raises scraper.ScrapeError when the scrape fails. Failures are not cached,
+    except pages that are gone (not_found), which are remembered in this process
+    for SCRAPE_CACHE_GONE_TTL seconds.
+    """
+    key = normalize_url(url)
+    gone = _gone.get(key)
+    if gone is not None:
+        raise scraper.ScrapeError("not_found", gone["message"])
+
+    product = _local.get(key)
+    if product is None and _shared is not None:
+        try:
+            product = _shared.get(key)
+        except Exception as e:
+            print(f"Shared scrape cache unavailable: {e}")
+        if product is not None:
+            _local.set(key, product)
+    if product is not None:
+        product["product_url"] = url.strip()
+        return product
+
+    try:
+        product = scraper.return_dict(url)
+    except scraper.ScrapeError as e:
+        if e.kind == "not_found" and SCRAPE_CACHE_GONE_TTL > 0:
+            _gone.set(key, {"message": str(e)})
+        raise
+
+    product["scraped_at"] = datetime.now(timezone.utc)
+    _local.set(key, product)
+    if _shared is not None:
+        try:
+            _shared.set(key, product)
+        except Exception as e:
+            print(f"Shared scrape cache unavailable: {e}")
+    return dict(product)
+
+
+def invalidate(url):
+    "Drops url from the local and shared cache"
+    key = normalize_url(url)
+    _local.invalidate(key)
+    _gone.invalidate(key)
+    if _shared is not None:
+        _shared.invalidate(key)
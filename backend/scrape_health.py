@@ -0,0 +1,128 @@
+# scrape_health.py
+"""Per-domain circuit breaker and the scrape failure log.
+
+A domain's breaker opens after BREAKER_FAILURE_THRESHOLD consecutive
+host-level failures (timeouts, blocks, network errors) and stays open for
+BREAKER_OPEN_SECONDS, doubling each time it reopens up to
+BREAKER_MAX_OPEN_SECONDS. Once the window has passed the next scrape is a
+trial: a success closes the breaker, another failure reopens it. State lives
+in the domain_health table so every worker and the app share it.
+
+Every failed or skipped scrape is written to scrape_failures with its kind.
+"""
+import os
+
+from psycopg2.extras import execute_values
+
+from database import get_connection
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_OPEN_SECONDS = int(os.getenv('BREAKER_OPEN_SECONDS', 900))
+BREAKER_MAX_OPEN_SECONDS = int(os.getenv('BREAKER_MAX_OPEN_SECONDS', 6 * 3600))
+SCRAPE_FAILURES_RETENTION_DAYS = int(os.getenv('SCRAPE_FAILURES_RETENTION_DAYS', 30))
+
+# Failure kinds that say something about the store rather than one product page.
+HOST_ERROR_KINDS = ("timeout", "blocked", "network")
+
+RECORD_FAILURE_QUERY = """
+INSERT INTO domain_health AS d (domain, consecutive_failures, last_failure_kind, last_failure_at)
+VALUES (%(domain)s, 1, %(kind)s, NOW())
+ON CONFLICT (domain) DO UPDATE SET
+    consecutive_failures = d.consecutive_failures + 1,
+    last_failure_kind = EXCLUDED.last_failure_kind,
+    last_failure_at = NOW(),
+    opened_until = CASE
+        WHEN d.consecutive_failures + 1 >= %(threshold)s AND (d.opened_until IS NULL OR d.opened_until <= NOW())
+        THEN NOW() + make_interval(secs => LEAST(%(open)s * POWER(2, d.times_opened), %(max_open)s))
+        ELSE d.opened_until END,
+    times_opened = CASE
+        WHEN d.consecutive_failures + 1 >= %(threshold)s AND (d.opened_until IS NULL OR d.opened_until <= NOW())
+        THEN d.times_opened + 1
+        ELSE d.times_opened END
+RETURNING CASE WHEN d.opened_until > NOW() THEN d.opened_until END;
+"""
+
+RECORD_SUCCESS_QUERY = """
+UPDATE domain_health
+SET consecutive_failures = 0, times_opened = 0, opened_until = NULL, last_success_at = NOW()
+WHERE domain = ANY(%s) AND consecutive_failures > 0;
+"""
+
+LOG_QUERY = """
+INSERT INTO scrape_failures (product_id, product_url, domain, kind, action, message)
+VALUES %s
+"""
+
+
+def open_domains() -> dict:
+    "Returns {domain: opened_until} for every domain whose breaker is open"
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT domain, opened_until FROM domain_health WHERE opened_until > NOW();")
+            return dict(cur.fetchall())
+
+
+def open_until(domain):
+    "Returns when the domain's breaker closes, or None if it is closed"
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT opened_until FROM domain_health WHERE domain = %s AND opened_until > NOW();",
+                        (domain,))
+            row = cur.fetchone()
+    return row[0] if row else None
+
+
+def record_failure(domain, kind):
+    """Counts a failed scrape against the domain.
+
+    Returns the time the breaker stays open until if it is now open, else None.
+    Product-level kinds (not_found, parse) never trip the breaker.
+    """
+    if kind not in HOST_ERROR_KINDS or not domain:
+        return None
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(RECORD_FAILURE_QUERY, {
+                "domain": domain,
+                "kind": kind,
+                "threshold": BREAKER_FAILURE_THRESHOLD,
+                "open": BREAKER_OPEN_SECONDS,
+                "max_open": BREAKER_MAX_OPEN_SECONDS,
+            })
+            until = cur.fetchone()[0]
+        conn.commit()
+    return until
+
+
+def record_successes(domains):
+    "Closes the breakers of domains that scraped successfully"
+    if not domains:
+        return
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(RECORD_SUCCESS_QUERY, (sorted(domains),))
+        conn.commit()
+
+
+def log_failures(cur, rows):
+    "Writes (product_id, product_url, domain, kind, action, message) rows to scrape_failures"
+    if rows:
+        execute_values(cur, LOG_QUERY, rows)
+
+
+def log_failure(product_id, product_url, domain, kind, action, message):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            log_failures(cur, [(product_id, product_url, domain, kind, action, message)])
+        conn.commit()
+
+
+def purge_failures(retention_days=SCRAPE_FAILURES_RETENTION_DAYS):
+    "Deletes scrape_failures rows older than the retention period"
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM scrape_failures WHERE occurred_at < NOW() - make_interval(days => %s);",
+                        (retention_days,))
+            deleted = cur.rowcount
+        conn.commit()
+    return deleted
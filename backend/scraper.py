@@ -1,10 +1,117 @@
-from decimal import Decimal
-from playwright.sync_api import sync_playwright, TimeoutError
+from concurrent.futures import TimeoutError as FutureTimeout
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlsplit
+import json
+import os
 import re
+import time
+from browser_pool import PoolBusy, get_pool
+import extractors
+import metrics
+from throttle import host_of
 
 price_selector = "span.price-item.price-item--regular"
 item_selector = ".product__title h1"
 
+TRACKER_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "connect.facebook.com",
+    "hotjar.com",
+    "klaviyo.com",
+    "tiktok.com",
+    "pinimg.com",
+    "clarity.ms",
+)
+
+DEFAULT_SCRAPE_SETTINGS = {
+    # Wait until these selectors are attached instead of sleeping a fixed time.
+    "ready_selectors": [price_selector, item_selector],
+    "ready_timeout_ms": int(os.getenv('SCRAPER_READY_TIMEOUT_MS', 15000)),
+    "blocked_resource_types": ["image", "font", "media"],
+    "blocked_hosts": list(TRACKER_HOSTS),
+}
+
+# Upper bound on how long a pooled browser may spend on one scrape, from when it starts.
+BROWSER_SCRAPE_TIMEOUT = float(os.getenv('BROWSER_SCRAPE_TIMEOUT', 60))
+# How long a scrape may wait in the pool queue for a free browser.
+BROWSER_QUEUE_TIMEOUT = float(os.getenv('BROWSER_QUEUE_TIMEOUT', 120))
+
+# Per-domain overrides, e.g. SCRAPER_DOMAIN_SETTINGS='{"shop.example.com": {"ready_timeout_ms": 30000}}'
+DOMAIN_SCRAPE_SETTINGS = json.loads(os.getenv('SCRAPER_DOMAIN_SETTINGS', '{}'))
+
+
+BLOCKED_STATUSES = (401, 403, 429, 503)
+
+
+class ScrapeError(Exception):
+    """A failed scrape. kind is one of:
+
+    not_found      the page answered 404/410
+    blocked        the store refused the request (401/403/429/503)
+    timeout        navigation, the ready selectors or the scrape itself timed out
+    pool_busy      no local browser was free in time; says nothing about the store
+    network        DNS, connection or TLS errors
+    parse          the page loaded but had no readable price or title
+    circuit_open   skipped because the store's circuit breaker is open (scrape_health.py)
+    error          anything else
+    """
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+def classify_error(e) -> ScrapeError:
+    "Wraps any scrape exception in a ScrapeError with the matching kind"
+    if isinstance(e, ScrapeError):
+        return e
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    if status in extractors.GONE_STATUSES:
+        kind = "not_found"
+    elif status in BLOCKED_STATUSES:
+        kind = "blocked"
+    elif isinstance(e, PoolBusy):
+        kind = "pool_busy"
+    elif isinstance(e, FutureTimeout) or type(e).__name__ == "TimeoutError":
+        # Playwright's TimeoutError is not a builtin subclass.
+        kind = "timeout"
+    elif isinstance(e, (ValueError, InvalidOperation)):
+        kind = "parse"
+    elif isinstance(e, (ConnectionError, OSError)) or "net::ERR_" in str(e):
+        kind = "network"
+    else:
+        kind = "error"
+    return ScrapeError(kind, str(e) or e.__class__.__name__)
+
+
+def settings_for(url):
+    """ merge the default scrape settings with any override for the url's domain """
+    host = (urlsplit(url).hostname or "").lower()
+    settings = dict(DEFAULT_SCRAPE_SETTINGS)
+    for domain, overrides in DOMAIN_SCRAPE_SETTINGS.items():
+        if host == domain or host.endswith("." + domain):
+            settings.update(overrides)
+    return settings
+
+
+def _route_filter(settings):
+    blocked_types = set(settings["blocked_resource_types"])
+    blocked_hosts = tuple(settings["blocked_hosts"])
+
+    def handle(route):
+        request = route.request
+        host = (urlsplit(request.url).hostname or "").lower()
+        if request.resource_type in blocked_types or host.endswith(blocked_hosts):
+            route.abort()
+        else:
+            route.continue_()
+
+    return handle
+
+
 def find_products(page):
     """ scrape product name and price from a given URL """
     price_element = page.query_selector(price_selector)
@@ -20,20 +127,65 @@ def find_products(page):
     
     return {"product_name": item_element, "product_price": price_value}
 
+def scrape_page(page, url, deadline=None):
+    """ load url in a pooled page and extract the product once it is ready.
+    deadline is the pool's time.monotonic() budget for the whole scrape; no wait runs past it. """
+    from playwright.sync_api import TimeoutError
+
+    settings = settings_for(url)
+    ready_deadline = time.monotonic() + settings["ready_timeout_ms"] / 1000
+    if deadline is not None:
+        ready_deadline = min(ready_deadline, deadline)
+
+    if settings["blocked_resource_types"] or settings["blocked_hosts"]:
+        page.route("**/*", _route_filter(settings))
+
+    domain = host_of(url)
+    with metrics.span("navigation", domain=domain):
+        remaining = max(ready_deadline - time.monotonic(), 0) * 1000
+        response = page.goto(url, wait_until="domcontentloaded", timeout=remaining or 1)
+    if response is not None and response.status in extractors.GONE_STATUSES:
+        raise ScrapeError("not_found", f"HTTP {response.status}")
+    if response is not None and response.status in BLOCKED_STATUSES:
+        raise ScrapeError("blocked", f"HTTP {response.status}")
+    with metrics.span("selector_wait", domain=domain):
+        for selector in settings["ready_selectors"]:
+            remaining = max(ready_deadline - time.monotonic(), 0) * 1000
+            try:
+                page.wait_for_selector(selector, state="attached", timeout=remaining or 1)
+            except TimeoutError:
+                # find_products reports which element is missing
+                break
+    with metrics.span("parse", domain=domain):
+        return find_products(page)
+
 def return_dict(url):
-    """ return product name, price and, url as a dictionary"""
-    with sync_playwright() as p:
-        browser= p.chromium.launch(headless=True).new_page()
-        
-        try:
-            browser.goto(url.strip())
-            browser.wait_for_timeout(5000)
-            product = find_products(browser)
-            product["product_url"] = url.strip()
-            print(product)
-            return product
-        except Exception as e:
-            print("Error:", e)
-        finally:
-            browser.close()
-            
\ No newline at end of file
+    """ return product name, price and, url as a dictionary.
+
+    Plain HTTP extractors are tried first; the pooled browser is only used when
+    none of them can read the page. "source" records which path served the url.
+    Raises ScrapeError when the product cannot be read.
+    """
+    url = url.strip()
+    domain = host_of(url)
+    source = None
+    try:
+        with metrics.span("http_extract", domain=domain):
+            product, source = extractors.extract(url)
+        if product is None:
+            source = "browser"
+            with metrics.span("browser_scrape", domain=domain):
+                product = get_pool().run(lambda page, deadline: scrape_page(page, url, deadline),
+                                         timeout=BROWSER_SCRAPE_TIMEOUT, queue_timeout=BROWSER_QUEUE_TIMEOUT)
+        product["product_url"] = url
+        product["source"] = source
+        metrics.incr("scrapes_total", domain=domain, source=source, outcome="ok")
+        print(product)
+        return product
+    except Exception as e:
+        error = classify_error(e)
+        metrics.incr("scrapes_total", domain=domain, source=source or "http", outcome=error.kind)
+        print(f"Error scraping {url} ({error.kind}): {error}")
+        if error is e:
+            raise
+        raise error from e
@@ -0,0 +1,47 @@
+# tests/test_app.py
+"""Access to the operational endpoints of the Flask app."""
+import os
+import sys
+import unittest
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import app  # noqa: E402
+
+STATS = {"in_use": 1, "idle": 3}
+
+
+class PoolStatsAccessTest(unittest.TestCase):
+    def setUp(self):
+        for target, value in (("pool_stats", lambda: STATS), ("OPS_TOKEN", None)):
+            patcher = mock.patch.object(app, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(app.jobs, "start_workers")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.app.test_client()
+
+    def get(self, remote_addr="127.0.0.1", headers=None):
+        return self.client.get("/pool_stats", headers=headers, environ_base={"REMOTE_ADDR": remote_addr})
+
+    def test_local_requests_are_allowed_without_a_token(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), STATS)
+
+    def test_remote_requests_are_refused_without_a_token(self):
+        self.assertEqual(self.get("203.0.113.9").status_code, 403)
+
+    def test_token_is_required_once_configured(self):
+        with mock.patch.object(app, "OPS_TOKEN", "s3cret"):
+            self.assertEqual(self.get().status_code, 403)
+            self.assertEqual(self.get(headers={"Authorization": "Bearer wrong"}).status_code, 403)
+            response = self.get("203.0.113.9", headers={"Authorization": "Bearer s3cret"})
+            self.assertEqual(response.status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
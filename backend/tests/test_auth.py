@@ -0,0 +1,70 @@
+# tests/test_auth.py
+"""run_hasher recovers when a bcrypt worker process dies."""
+import os
+import signal
+import sys
+import unittest
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ["AUTH_POOL_WORKERS"] = "1"
+
+import auth  # noqa: E402
+
+
+def crash():
+    os._exit(1)
+
+
+class FakeConnection:
+    def __init__(self, row):
+        self.row = row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+    def commit(self):
+        pass
+
+
+class RunHasherRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(self.shutdown_pool)
+        self.hashed = auth.hash_password("secret-password")
+
+    def shutdown_pool(self):
+        if auth._executor is not None:
+            auth._discard_executor(auth._executor)
+
+    def login(self):
+        with mock.patch.object(auth, "get_connection", lambda: FakeConnection((7, self.hashed))):
+            return auth.login_user("ann", "secret-password")
+
+    def test_login_succeeds_after_worker_is_killed(self):
+        pid = auth.run_hasher(os.getpid)
+        os.kill(pid, signal.SIGKILL)
+        self.assertEqual(self.login(), 7)
+        self.assertNotEqual(auth.run_hasher(os.getpid), pid)
+
+    def test_pool_that_keeps_breaking_sheds_load(self):
+        with self.assertRaises(auth.AuthOverloaded):
+            auth.run_hasher(crash)
+        self.assertEqual(self.login(), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
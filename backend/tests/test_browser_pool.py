@@ -0,0 +1,71 @@
+# tests/test_browser_pool.py
+"""BrowserPool deadlines, with the Chromium launch replaced by fake browsers."""
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import TimeoutError as FutureTimeout
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import browser_pool  # noqa: E402
+
+
+class FakePage:
+    def __init__(self):
+        self.default_timeout = None
+
+    def set_default_timeout(self, timeout):
+        self.default_timeout = timeout
+
+    def close(self):
+        pass
+
+
+class FakeBrowser:
+    def new_page(self):
+        return FakePage()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class BrowserPoolDeadlineTest(unittest.TestCase):
+    def setUp(self):
+        self.launches = []
+
+        def launch(slot):
+            slot.browser = slot.context = FakeBrowser()
+            slot.uses = 0
+            self.launches.append(slot.name)
+
+        patcher = mock.patch.object(browser_pool._BrowserSlot, "_launch", launch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = browser_pool.BrowserPool(size=1, max_uses=100)
+        self.addCleanup(self.pool.close)
+
+    def test_job_gets_the_budget_as_page_timeout_and_deadline(self):
+        def job(page, deadline):
+            return page.default_timeout, deadline - time.monotonic()
+
+        default_timeout, remaining = self.pool.run(job, timeout=5)
+        self.assertEqual(default_timeout, 5000)
+        self.assertTrue(4 < remaining <= 5)
+        self.assertEqual(self.pool.run(lambda page, deadline: deadline), None)
+
+    def test_job_over_its_deadline_recycles_the_slot(self):
+        with self.assertRaises(FutureTimeout):
+            self.pool.run(lambda page, deadline: time.sleep(0.3), timeout=0.1)
+        # The next job runs on a relaunched browser once the slow one returns.
+        self.assertEqual(self.pool.run(lambda page, deadline: "ok", timeout=5), "ok")
+        self.assertEqual(len(self.launches), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
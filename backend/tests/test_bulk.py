@@ -0,0 +1,154 @@
+# tests/test_bulk.py
+"""bulk.parse_import for CSV and NDJSON uploads, including malformed rows."""
+import os
+import sys
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import bulk  # noqa: E402
+
+URL = "https://shop.example.com/products/racket"
+
+
+class ParseCsvTest(unittest.TestCase):
+    def test_rows_without_header(self):
+        rows, errors = bulk.parse_import(f"{URL},99.50\nhttps://shop.example.com/products/bag,20\n", "csv")
+        self.assertEqual(rows, {URL: (1, Decimal("99.50")),
+                                "https://shop.example.com/products/bag": (2, Decimal("20"))})
+        self.assertEqual(errors, [])
+
+    def test_header_columns_in_any_order(self):
+        rows, errors = bulk.parse_import(f"target_price,url\n42,{URL}\n", "csv")
+        self.assertEqual(rows, {URL: (2, Decimal("42"))})
+        self.assertEqual(errors, [])
+
+    def test_later_lines_win_for_repeated_urls(self):
+        rows, _ = bulk.parse_import(f"{URL},10\n{URL},12\n", "csv")
+        self.assertEqual(rows, {URL: (2, Decimal("12"))})
+
+    def test_blank_lines_are_skipped(self):
+        rows, errors = bulk.parse_import(f"\n{URL},10\n,\n", "csv")
+        self.assertEqual(rows, {URL: (2, Decimal("10"))})
+        self.assertEqual(errors, [])
+
+    def test_malformed_rows_are_reported_per_line(self):
+        text = "\n".join([
+            URL,                        # missing price
+            "ftp://example.com/x,10",   # bad scheme
+            f"{URL}/a,abc",             # not a number
+            f"{URL}/b,-1",              # not positive
+            f"{URL}/c,1e400",           # a finite Decimal, just huge
+            f"{URL}/d,NaN",
+            f"{URL}/e,100000000",       # beyond NUMERIC(10, 2)
+            f"{URL}/f,5",
+        ])
+        rows, errors = bulk.parse_import(text, "csv")
+        self.assertEqual(rows, {f"{URL}/f": (8, Decimal("5"))})
+        self.assertEqual(errors, [
+            {"line": 1, "error": "Expected url,target_price"},
+            {"line": 2, "error": "Invalid URL format"},
+            {"line": 3, "error": "Target price must be a valid number"},
+            {"line": 4, "error": "Target price must be greater than 0"},
+            {"line": 5, "error": "Target price is too large"},
+            {"line": 6, "error": "Target price must be a finite number"},
+            {"line": 7, "error": "Target price is too large"},
+        ])
+
+    def test_header_without_url_value(self):
+        rows, errors = bulk.parse_import("url,target_price\n,10\n", "csv")
+        self.assertEqual(rows, {})
+        self.assertEqual(errors, [{"line": 2, "error": "Invalid URL format"}])
+
+
+class ParseNdjsonTest(unittest.TestCase):
+    def test_numbers_and_strings(self):
+        text = f'{{"url": "{URL}", "target_price": 10.5}}\n{{"product_url": "{URL}/b", "target_price": "7"}}\n'
+        rows, errors = bulk.parse_import(text, "ndjson")
+        self.assertEqual(rows, {URL: (1, Decimal("10.5")), f"{URL}/b": (2, Decimal("7"))})
+        self.assertEqual(errors, [])
+
+    def test_malformed_records_are_reported_per_line(self):
+        text = "\n".join([
+            "{not json",
+            "[1, 2]",
+            '{"url": 5, "target_price": 3}',
+            '{"target_price": 3}',
+            f'{{"url": "{URL}/a", "target_price": 1e400}}',
+            f'{{"url": "{URL}/b", "target_price": true}}',
+            f'{{"url": "{URL}/c", "target_price": null}}',
+            f'{{"url": "{URL}/d", "target_price": {{"amount": 3}}}}',
+            f'{{"url": "{URL}/e", "target_price": 3}}',
+        ])
+        rows, errors = bulk.parse_import(text, "ndjson")
+        self.assertEqual(rows, {f"{URL}/e": (9, Decimal("3"))})
+        self.assertEqual(errors, [
+            {"line": 1, "error": "Invalid JSON"},
+            {"line": 2, "error": "Expected an object with url and target_price"},
+            {"line": 3, "error": "URL must be a string"},
+            {"line": 4, "error": "URL is required"},
+            {"line": 5, "error": "Target price must be a finite number"},
+            {"line": 6, "error": "Target price must be a valid number"},
+            {"line": 7, "error": "Target price must be a valid number"},
+            {"line": 8, "error": "Target price must be a valid number"},
+        ])
+
+
+class FakeExportConnection:
+    "Serves EXPORT_QUERY batches from pages and tracks whether it is checked out"
+
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+
+    def __enter__(self):
+        self.db.open += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.db.open -= 1
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params):
+        self.db.params.append(params)
+        self._rows = [row for row in self.db.rows if row[0] > params["after"]]
+        ids = sorted({row[0] for row in self._rows})[:params["limit"]]
+        self._rows = [row for row in self._rows if row[0] in ids]
+
+    def fetchall(self):
+        return self._rows
+
+
+class ExportRowsTest(unittest.TestCase):
+    def test_batches_release_the_connection_before_yielding(self):
+        db = mock.Mock(open=0, params=[], rows=[(pid, f"Item {pid}", URL, Decimal("10"), Decimal("9"), None, None)
+                                                 for pid in (3, 5, 8)])
+        exported = []
+        with mock.patch.object(bulk, "get_connection", lambda: FakeExportConnection(db)), \
+                mock.patch.object(bulk, "EXPORT_BATCH_PRODUCTS", 2):
+            for row in bulk.export_rows(7):
+                self.assertEqual(db.open, 0)
+                exported.append(row[0])
+        self.assertEqual(exported, [3, 5, 8])
+        self.assertEqual([params["after"] for params in db.params], [0, 5, 8])
+
+
+class ParseImportTest(unittest.TestCase):
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            bulk.parse_import(f"{URL},10", "xml")
+
+    def test_row_limit(self):
+        text = "\n".join(f"{URL}/{n},10" for n in range(4))
+        with mock.patch.object(bulk, "IMPORT_MAX_ROWS", 3), self.assertRaises(ValueError):
+            bulk.parse_import(text, "csv")
+
+
+if __name__ == "__main__":
+    unittest.main()
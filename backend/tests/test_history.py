@@ -0,0 +1,110 @@
+# tests/test_history.py
+"""maintain_price_history against a scratch Postgres database.
+
+Runs only when BENCH_DB_NAME (and BENCH_DB_USER/PASSWORD/HOST/PORT) point at a
+scratch database, the same settings benchmarks/seed.py uses.
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import database  # noqa: E402
+import history  # noqa: E402
+from schema import apply_schema  # noqa: E402
+
+PRODUCT_URL = "https://history-test.invalid/products/racket"
+
+
+@unittest.skipUnless(os.getenv("BENCH_DB_NAME"), "set BENCH_DB_NAME to a scratch database")
+class MaintainPriceHistoryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        settings = {f"DB_{key}": os.getenv(f"BENCH_DB_{key}", getattr(database, f"DB_{key}"))
+                    for key in ("NAME", "USER", "PASSWORD", "HOST", "PORT")}
+        cls.patcher = mock.patch.multiple(database, **settings)
+        cls.patcher.start()
+        database.close_pool()
+        apply_schema()
+
+    @classmethod
+    def tearDownClass(cls):
+        database.close_pool()
+        cls.patcher.stop()
+
+    def setUp(self):
+        self.query("TRUNCATE price_history, price_history_hourly, price_history_daily;")
+        self.query("DELETE FROM products WHERE product_url = %s;", (PRODUCT_URL,))
+        self.product_id = self.query(
+            "INSERT INTO products (product_url, product_name, current_price) VALUES (%s, 'Racket', 100) "
+            "RETURNING product_id;", (PRODUCT_URL,))[0][0]
+        self.addCleanup(self.query, "DELETE FROM products WHERE product_id = %s;", (self.product_id,))
+
+    def query(self, sql, params=()):
+        with database.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall() if cur.description else None
+            conn.commit()
+        return rows
+
+    def maintain(self, raw_days, lookback_hours):
+        with mock.patch.multiple(history, HISTORY_RAW_RETENTION_DAYS=raw_days, HISTORY_HOURLY_RETENTION_DAYS=0,
+                                 HISTORY_DAILY_RETENTION_DAYS=0, HISTORY_ROLLUP_LOOKBACK_HOURS=lookback_hours):
+            history.maintain_price_history()
+
+    def test_prune_after_gap_longer_than_lookback_keeps_every_hour(self):
+        # One price per hour for six days; the last maintain run was six days ago.
+        self.query("""
+        INSERT INTO price_history (history_pid, recorded_price, time_change)
+        SELECT %s, 100 + EXTRACT(HOUR FROM t), t
+        FROM generate_series(date_trunc('hour', NOW()) - INTERVAL '6 days' + INTERVAL '30 minutes',
+                             NOW(), INTERVAL '1 hour') AS t;
+        """, (self.product_id,))
+        self.query("""
+        INSERT INTO price_history_hourly (history_pid, bucket, min_price, max_price, last_price, last_at, samples)
+        SELECT history_pid, date_trunc('hour', time_change), recorded_price, recorded_price, recorded_price,
+               time_change, 1
+        FROM price_history WHERE history_pid = %s ORDER BY time_change LIMIT 1;
+        """, (self.product_id,))
+        hours_before = self.query("""
+        SELECT date_trunc('hour', time_change), recorded_price FROM price_history
+        WHERE history_pid = %s AND time_change < NOW() - INTERVAL '2 days' ORDER BY 1;
+        """, (self.product_id,))
+
+        self.maintain(raw_days=2, lookback_hours=48)
+
+        rolled = self.query("""
+        SELECT bucket, last_price FROM price_history_hourly
+        WHERE history_pid = %s AND bucket < NOW() - INTERVAL '2 days' ORDER BY bucket;
+        """, (self.product_id,))
+        self.assertEqual(rolled[:len(hours_before)], hours_before)
+        # The raw rows past retention are gone only because their hours were rolled up first.
+        left = self.query("SELECT COUNT(*) FROM price_history WHERE history_pid = %s "
+                          "AND time_change < NOW() - INTERVAL '2 days';", (self.product_id,))[0][0]
+        self.assertEqual(left, 0)
+
+    def test_enabling_retention_rolls_up_existing_history_first(self):
+        self.query("""
+        INSERT INTO price_history (history_pid, recorded_price, time_change)
+        SELECT %s, 100, t FROM generate_series(NOW() - INTERVAL '10 days', NOW() - INTERVAL '5 days',
+                                               INTERVAL '1 day') AS t;
+        """, (self.product_id,))
+
+        self.maintain(raw_days=3, lookback_hours=48)
+
+        buckets = self.query("SELECT COUNT(*) FROM price_history_hourly WHERE history_pid = %s;",
+                             (self.product_id,))[0][0]
+        self.assertEqual(buckets, 6)
+        left = self.query("SELECT COUNT(*) FROM price_history WHERE history_pid = %s;", (self.product_id,))[0][0]
+        self.assertEqual(left, 1)
+        # The graph still starts at the oldest, now pruned, point.
+        points = history.price_points(self.product_id, resolution="hour")
+        self.assertLess(points[0][0], self.query("SELECT NOW() - INTERVAL '9 days';")[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
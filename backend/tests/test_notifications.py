@@ -0,0 +1,126 @@
+# tests/test_notifications.py
+"""check_and_notify_targets against the fake SMTP sink.
+
+The database is replaced by a fake connection that returns the claimed rows
+and records every statement, so only the SMTP side runs for real.
+"""
+import functools
+import os
+import sys
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+import notifications  # noqa: E402
+import price_updater  # noqa: E402
+from fake_smtp import start_sink  # noqa: E402
+
+# (userprofileid, email, usersitemid, product_name, product_url, current_price, target_price)
+CLAIMED = [
+    (1, "ann@example.com", 10, "Racket 10", "https://shop.example.com/products/10", Decimal("80.00"), Decimal("90.00")),
+    (1, "ann@example.com", 11, "Racket 11", "https://shop.example.com/products/11", Decimal("50.00"), Decimal("60.00")),
+    (2, "bob@example.com", 12, "Racket 12", "https://shop.example.com/products/12", Decimal("70.00"), Decimal("75.00")),
+]
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.db.statements.append((query, params))
+        self._rows = list(CLAIMED) if "SET notified = TRUE" in query else []
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        self.db.commits += 1
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.statements = []
+        self.batches = []
+        self.commits = 0
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def execute_values(self, cur, query, rows, **kwargs):
+        self.batches.append((query, list(rows)))
+
+    def batch(self, table):
+        "Returns the rows written to table with execute_values"
+        return [row for query, rows in self.batches if table in query for row in rows]
+
+
+class CheckAndNotifyTargetsTest(unittest.TestCase):
+    def notify(self, reject=()):
+        sink, port = start_sink(reject=reject)
+        self.addCleanup(sink.server_close)
+        self.addCleanup(sink.shutdown)
+        db = FakeDatabase()
+        pool = functools.partial(notifications.SMTPSessionPool, host="127.0.0.1", port=port)
+        with mock.patch.object(price_updater, "get_connection", db.connect), \
+                mock.patch.object(price_updater, "execute_values", db.execute_values), \
+                mock.patch.object(notifications, "SMTPSessionPool", pool), \
+                mock.patch.object(notifications, "SMTP_STARTTLS", False), \
+                mock.patch.object(notifications, "SENDER_PASSWORD", None):
+            price_updater.check_and_notify_targets(full=True)
+        return sink, db
+
+    def test_one_digest_per_user(self):
+        sink, db = self.notify()
+        self.assertEqual(sink.messages, 2)
+        self.assertCountEqual(sink.recipients, [["ann@example.com"], ["bob@example.com"]])
+
+    def test_only_claimed_items_are_marked_notified(self):
+        sink, db = self.notify()
+        marks = [query for query, _ in db.statements if "SET notified = TRUE" in query]
+        self.assertEqual(len(marks), 1)
+        self.assertIn("ut.notified = FALSE", marks[0])
+        # Every claimed item is recorded as sent and none is released again.
+        deliveries = db.batch("notification_deliveries")
+        self.assertEqual(sorted((row[0], row[1], row[4]) for row in deliveries),
+                         [(1, 10, "sent"), (1, 11, "sent"), (2, 12, "sent")])
+        self.assertEqual(db.batch("SET notified = FALSE"), [])
+
+    def test_failed_digest_releases_its_items(self):
+        sink, db = self.notify(reject={"ann@example.com"})
+        self.assertEqual(sink.recipients, [["bob@example.com"]])
+        # Only ann's items go back to notified = FALSE and are queued for the next run.
+        self.assertCountEqual(db.batch("SET notified = FALSE"), [(10, 1), (11, 1)])
+        requeued = [params for query, params in db.statements if "resets_checked" in query and params]
+        self.assertEqual(requeued, [([10, 11],)])
+        statuses = {row[1]: row[4] for row in db.batch("notification_deliveries")}
+        self.assertEqual(statuses, {10: "failed", 11: "failed", 12: "sent"})
+
+
+if __name__ == "__main__":
+    unittest.main()
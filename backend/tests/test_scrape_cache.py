@@ -0,0 +1,53 @@
+# tests/test_scrape_cache.py
+"""normalize_url keys and what get_product hands back from the cache."""
+import os
+import sys
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import scrape_cache  # noqa: E402
+
+URL = "https://shop.example.com/products/racket"
+
+
+class NormalizeUrlTest(unittest.TestCase):
+    def test_tracking_params_are_dropped(self):
+        self.assertEqual(scrape_cache.normalize_url(f"{URL}/?utm_source=mail&fbclid=1&ref=home&size=m#reviews"),
+                         f"{URL}?size=m")
+
+    def test_params_that_only_start_like_tracking_are_kept(self):
+        self.assertEqual(scrape_cache.normalize_url(f"{URL}?reference=R1&referrer=a"),
+                         f"{URL}?reference=R1&referrer=a")
+
+    def test_scheme_and_host_are_lowercased(self):
+        self.assertEqual(scrape_cache.normalize_url("HTTPS://Shop.Example.com/products/racket"), URL)
+
+
+class GetProductTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(scrape_cache, _local=scrape_cache.ScrapeCache(),
+                                      _gone=scrape_cache.ScrapeCache(), _shared=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scrape(self, url):
+        return {"product_url": url.strip(), "product_name": "Racket", "product_price": Decimal("99.00"),
+                "source": "json_ld"}
+
+    def test_cached_product_carries_the_callers_url(self):
+        with mock.patch.object(scrape_cache.scraper, "return_dict", side_effect=self.scrape) as scrape:
+            first = scrape_cache.get_product(f"{URL}?utm_source=mail")
+            second = scrape_cache.get_product(f"{URL}?utm_source=ads")
+        self.assertEqual(scrape.call_count, 1)
+        self.assertEqual(first["product_url"], f"{URL}?utm_source=mail")
+        self.assertEqual(second["product_url"], f"{URL}?utm_source=ads")
+        # The timestamp is the original scrape's, not the cache hit's.
+        self.assertEqual(second["scraped_at"], first["scraped_at"])
+
+
+if __name__ == "__main__":
+    unittest.main()
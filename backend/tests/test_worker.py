@@ -0,0 +1,63 @@
+# tests/test_worker.py
+"""Scheduler edge cases and price_refresher honouring the worker's stop event."""
+import os
+import sys
+import threading
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import price_updater  # noqa: E402
+import worker  # noqa: E402
+
+
+class FakeConnection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_no_configured_jobs_returns(self):
+        scheduler = worker.Scheduler([worker.Job("refresh", mock.Mock(), 0)])
+        scheduler.loop()
+        self.assertEqual(scheduler.jobs, [])
+
+    def test_stop_ends_the_loop_after_the_current_job(self):
+        stop = threading.Event()
+        job = worker.Job("refresh", stop.set, 60)
+        worker.Scheduler([job], stop=stop).loop()
+        self.assertEqual(job.runs, 1)
+
+
+class PriceRefresherStopTest(unittest.TestCase):
+    def test_stop_finishes_the_claimed_batch_without_claiming_more(self):
+        stop = threading.Event()
+        batches = [[(1, "https://shop.example.com/products/1", Decimal("10.00"))],
+                   [(2, "https://shop.example.com/products/2", Decimal("20.00"))]]
+
+        def claim(worker_id, limit):
+            stop.set()
+            return batches.pop(0)
+
+        writer = mock.Mock(written=1, changed=1)
+        with mock.patch.object(price_updater, "get_connection", FakeConnection), \
+                mock.patch.object(price_updater, "PriceWriter", return_value=writer), \
+                mock.patch.object(price_updater, "scrape_health") as scrape_health, \
+                mock.patch.object(price_updater, "claim_products", side_effect=claim) as claim_products, \
+                mock.patch.object(price_updater, "_scrape", return_value={"product_price": Decimal("9.00")}):
+            scrape_health.open_domains.return_value = {}
+            price_updater.price_refresher(stop=stop)
+
+        self.assertEqual(claim_products.call_count, 1)
+        writer.add.assert_called_once_with(1, Decimal("10.00"), Decimal("9.00"))
+        writer.flush.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
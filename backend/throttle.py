@@ -0,0 +1,56 @@
+# throttle.py
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+def host_of(url) -> str:
+    "Returns the lowercased host of a URL"
+    return (urlsplit(url.strip()).hostname or "").lower()
+
+
+class HostLimiter:
+    """Caps in-flight requests and request rate per host.
+
+    max_in_flight <= 0 disables the concurrency cap, rate_per_second <= 0 disables
+    the rate cap.
+    """
+
+    def __init__(self, max_in_flight=2, rate_per_second=0.0):
+        self.max_in_flight = max_in_flight
+        self.min_interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = defaultdict(float)
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_in_flight)
+            return self._semaphores[host]
+
+    def _wait_for_turn(self, host):
+        if not self.min_interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start[host])
+            self._next_start[host] = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    @contextmanager
+    def slot(self, url):
+        "Blocks until a request to url's host is allowed, then holds a slot for it"
+        host = host_of(url)
+        semaphore = self._semaphore(host) if self.max_in_flight > 0 else None
+        if semaphore:
+            semaphore.acquire()
+        try:
+            self._wait_for_turn(host)
+            yield host
+        finally:
+            if semaphore:
+                semaphore.release()
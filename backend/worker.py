@@ -0,0 +1,173 @@
+# worker.py
+"""Resident scheduler for the price_updater jobs.
+
+Runs price_refresher, check_and_notify_targets and reset_notified_prices on
+their own intervals inside one process, so the browser pool and database
+pool stay warm between runs. Jobs never overlap. SIGTERM/SIGINT let the
+current job finish before shutting down; price_refresher stops claiming
+after its current batch. GET /health on WORKER_HEALTH_PORT
+reports job state, and GET /metrics serves the metrics registry when
+METRICS_ENABLED is set.
+
+Usage: python worker.py
+"""
+import functools
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import price_updater
+from browser_pool import close_pool
+from database import close_pool as close_db_pool
+from history import maintain_price_history
+import metrics
+
+WORKER_REFRESH_INTERVAL = int(os.getenv('WORKER_REFRESH_INTERVAL', 1800))
+WORKER_NOTIFY_INTERVAL = int(os.getenv('WORKER_NOTIFY_INTERVAL', 1800))
+WORKER_RESET_INTERVAL = int(os.getenv('WORKER_RESET_INTERVAL', 3600))
+# 0 disables the job.
+WORKER_MAINTAIN_INTERVAL = int(os.getenv('WORKER_MAINTAIN_INTERVAL', 0))
+WORKER_HEALTH_PORT = int(os.getenv('WORKER_HEALTH_PORT', 8081))
+# /health turns unhealthy when one job has been running longer than this.
+WORKER_STALL_SECONDS = int(os.getenv('WORKER_STALL_SECONDS', 3600))
+
+
+class Job:
+    def __init__(self, name, fn, interval):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.next_run = time.monotonic()
+        self.last_started = None
+        self.last_finished = None
+        self.last_duration = None
+        self.last_error = None
+        self.runs = 0
+        self.failures = 0
+
+    def state(self):
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_started": self.last_started,
+            "last_finished": self.last_finished,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    def __init__(self, jobs, stop=None):
+        self.jobs = [job for job in jobs if job.interval > 0]
+        self.stop = stop or threading.Event()
+        self.current = None
+        self._current_started = None
+
+    def run_job(self, job):
+        self.current = job
+        self._current_started = time.monotonic()
+        job.last_started = datetime.now(timezone.utc).isoformat()
+        print(f"Starting {job.name}")
+        try:
+            job.fn()
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+        finally:
+            job.runs += 1
+            job.last_duration = round(time.monotonic() - self._current_started, 3)
+            job.last_finished = datetime.now(timezone.utc).isoformat()
+            job.next_run = time.monotonic() + job.interval
+            self.current = None
+            self._current_started = None
+            print(f"Finished {job.name} in {job.last_duration}s")
+
+    def loop(self):
+        if not self.jobs:
+            print("No jobs configured (every WORKER_*_INTERVAL is 0), nothing to run")
+            return
+        while not self.stop.is_set():
+            job = min(self.jobs, key=lambda j: j.next_run)
+            delay = job.next_run - time.monotonic()
+            if delay > 0:
+                self.stop.wait(delay)
+                continue
+            self.run_job(job)
+
+    def health(self):
+        # Called from the health server thread; read each shared field once.
+        current = self.current
+        started = self._current_started
+        stalled = started is not None and time.monotonic() - started > WORKER_STALL_SECONDS
+        return {
+            "status": "stalled" if stalled else ("stopping" if self.stop.is_set() else "ok"),
+            "running": current.name if current else None,
+            "jobs": {job.name: job.state() for job in self.jobs},
+        }
+
+
+def serve_health(scheduler, port=WORKER_HEALTH_PORT):
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics" and metrics.METRICS_ENABLED:
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", metrics.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if self.path != "/health":
+                self.send_error(404)
+                return
+            health = scheduler.health()
+            body = json.dumps(health).encode()
+            self.send_response(200 if health["status"] == "ok" else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), HealthHandler)
+    threading.Thread(target=server.serve_forever, name="health", daemon=True).start()
+    return server
+
+
+def main():
+    stop = threading.Event()
+    scheduler = Scheduler([
+        Job("price_refresher", functools.partial(price_updater.price_refresher, stop=stop), WORKER_REFRESH_INTERVAL),
+        Job("check_and_notify_targets", price_updater.check_and_notify_targets, WORKER_NOTIFY_INTERVAL),
+        Job("reset_notified_prices", price_updater.reset_notified_prices, WORKER_RESET_INTERVAL),
+        Job("maintain_price_history", maintain_price_history, WORKER_MAINTAIN_INTERVAL),
+    ], stop=stop)
+
+    def shutdown(signum, frame):
+        print(f"Received signal {signum}, stopping after the current job")
+        scheduler.stop.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    server = serve_health(scheduler)
+    print(f"Worker started, health check on :{WORKER_HEALTH_PORT}/health")
+    try:
+        scheduler.loop()
+    finally:
+        server.shutdown()
+        close_pool()
+        close_db_pool()
+        print("Worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,8 +15,12 @@ export const addProduct = (productUrl, targetPrice) => {
   return client.post('/add_product', formData);
 };
 
+export const getAddProductStatus = (jobId) => {
+  return client.get(`/add_product_status?job_id=${jobId}`);
+};
+
 export const deleteProduct = (productId) => {
   const formData = new FormData();
   formData.append('product_id', productId);
   return client.post('/delete_product', formData);
-};
\ No newline at end of file
+};
@@ -1,8 +1,11 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { getDashboard, deleteProduct, addProduct, getPriceGraph} from '../api/products';
+import { getDashboard, deleteProduct, addProduct, getAddProductStatus, getPriceGraph} from '../api/products';
 import './Dashboard.css';
 
+const ADD_PRODUCT_POLL_MS = 1500;
+// Stop polling after about three minutes; the job keeps running on the server.
+const ADD_PRODUCT_MAX_POLLS = 120;
 
 export default function Dashboard() {
   const [products, setProducts] = useState([]);
@@ -31,13 +34,29 @@ export default function Dashboard() {
     }
   };
 
+  const waitForAddProduct = async (jobId) => {
+    // The backend scrapes in the background; poll until the job finishes or we give up.
+    for (let attempt = 0; attempt < ADD_PRODUCT_MAX_POLLS; attempt++) {
+      await new Promise((resolve) => setTimeout(resolve, ADD_PRODUCT_POLL_MS));
+      const { data } = await getAddProductStatus(jobId);
+      if (data.status === 'done') return data;
+    }
+    return null;
+  };
+
   const handleAddProduct = async (e) => {
     e.preventDefault();
     try {
-      await addProduct(productUrl, targetPrice);
+      const response = await addProduct(productUrl, targetPrice);
       setProductUrl('');
       setTargetPrice('');
       setShowAddForm(false);
+      const job = await waitForAddProduct(response.data.job_id);
+      if (!job) {
+        alert('Still processing this product. It will appear on your dashboard once it is ready.');
+      } else if (job.outcome !== 'success') {
+        alert(job.message || 'Failed to add product');
+      }
       fetchProducts();
     } catch (err) {
       alert(err.response?.data || 'Failed to add product');